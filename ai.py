@@ -0,0 +1,107 @@
+# imports
+import os
+import zlib
+import game
+
+# constants and globals
+NAME = "AI" # the AI's name as a player
+CELLS = game.BOARD_SIZE * game.BOARD_SIZE
+NO_MOVE = 255 # table entry of positions the AI never moves in
+table = bytearray() # key - crosses | noughts << CELLS : value - cell of the best move
+
+"""
+The AI plays perfectly on 3x3 boards, with its move for every reachable position solved
+by minimax once, so each move it makes is a table lookup. Cells are numbered
+size * row + col, as in game.py's bitboards
+
+All of the following functions use one or more of these args
+
+Args:
+    crosses (int): bitboard of the cells held by X
+    noughts (int): bitboard of the cells held by O
+"""
+class Seat:
+    """
+    Stands in for the AI's connection in its room, discarding what the room sends it
+    """
+    def sendall(self, data: bytes, limit: int = 0, coalesce: bool = False) -> bool:
+        return True
+
+    def shutdown(self, how: int) -> None:
+        pass
+
+def solve() -> bytearray:
+    """
+    Finds the best move in every reachable position with minimax, preferring the
+    fastest win and the slowest loss
+
+    Returns:
+        the table of best moves
+    """
+    moves = bytearray([NO_MOVE]) * (1 << 2 * CELLS)
+    scores = {} # key - table key : value - score of the position for the player to move
+
+    def score(crosses: int, noughts: int) -> int:
+        key = crosses | noughts << CELLS
+        if key in scores:
+            return scores[key]
+
+        taken = crosses | noughts
+        crosses_turn = bin(taken).count('1') % 2 == 0
+        best_score = -CELLS - 1
+        for cell in range(CELLS):
+            if taken >> cell & 1:
+                continue
+            if crosses_turn:
+                child = (crosses | 1 << cell, noughts)
+            else:
+                child = (crosses, noughts | 1 << cell)
+            empty = CELLS - bin(taken).count('1') - 1
+            # a win is worth more the sooner it comes, a full board is a draw
+            if game.bitboard_wins(child[0] if crosses_turn else child[1]):
+                cell_score = empty + 1
+            elif not empty:
+                cell_score = 0
+            else:
+                cell_score = -score(*child)
+            if cell_score > best_score:
+                best_score = cell_score
+                moves[key] = cell
+
+        scores[key] = best_score
+        return best_score
+
+    score(0, 0)
+    return moves
+
+def load(path: str = "") -> None:
+    """
+    Loads the table of best moves from a file, solving the game instead if there is no
+    file, then saving the table to it if given
+
+    Args:
+        path (str): file holding the table, compressed
+    """
+    global table
+    if path and os.path.exists(path):
+        with open(path, 'rb') as table_file:
+            table = bytearray(zlib.decompress(table_file.read()))
+        return
+
+    table = solve()
+    if path:
+        with open(path, 'wb') as table_file:
+            table_file.write(zlib.compress(bytes(table), 9))
+
+def best_move(bitboards: list[int]) -> tuple[int, int]:
+    """
+    Looks up the AI's move in a position
+
+    Args:
+        bitboards (list[int]): the room's game state, a position the AI is to move in
+
+    Returns:
+        (col, row) of the move
+    """
+    cell = table[bitboards[0] | bitboards[1] << CELLS]
+    return cell % game.BOARD_SIZE, cell // game.BOARD_SIZE
@@ -0,0 +1,327 @@
+# imports
+import sys
+import os
+import time
+import asyncio
+import resource
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import server
+import protocol
+import cluster
+import metrics
+import history
+import timers
+
+# constants and globals
+BLOCKING_COMMANDS = ("LOGIN", "REGISTER") # hash passwords, so are run off the event loop
+CLUSTER_COMMANDS = ("ROOMLIST",) # ask the other workers, so are run off the event loop
+                                 # when there are any
+
+class StreamClient(protocol.Connection):
+    """
+    A connection over asyncio streams, passed to the server's command functions in place
+    of a socket
+    Queued data is written by a task of its own
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.ready = asyncio.Event()
+        self.write_task = self.loop.create_task(self.write_outbox())
+
+    def wake(self) -> None:
+        if threading.get_ident() == self.loop_thread:
+            self.ready.set()
+        else:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def write_outbox(self) -> None:
+        """
+        Writes queued data, waiting for each write to drain before the next, until the
+        connection is closed
+        """
+        while not (self.closing and not self.outbox):
+            await self.ready.wait()
+            self.ready.clear()
+            self.writer.write(self.take_outbox())
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                break
+        self.writer.close()
+
+    async def recv_msg(self) -> list[str]:
+        """
+        Waits until a whole message has been received
+
+        Returns:
+            the message split into its arguments, [''] if the client disconnected
+        """
+        msg = self.next_message()
+        while msg is None:
+            data = await self.reader.read(protocol.MAX_MSG_SZ)
+            if not data:
+                return ['']
+            self.feed(data)
+            msg = self.next_message()
+        return msg
+
+    def close(self) -> None:
+        """
+        Closes the connection once its queued data is written, giving up on a client that
+        has not read it within protocol.CLOSE_TIMEOUT
+        """
+        self.closing = True
+        self.ready.set()
+        self.loop.call_later(protocol.CLOSE_TIMEOUT, self.writer.transport.abort)
+
+    def shutdown(self, how: int) -> None:
+        """
+        Drops the connection straight away, ending any pending recv_msg(), and marks it
+        as closing so a command held for it is let go
+        """
+        with self.lock:
+            self.closing = True
+            self.wake()
+        self.writer.transport.abort()
+
+    async def detach(self) -> socket.socket:
+        """
+        Stops reading, then closes the connection once its queued data is written,
+        leaving a copy of its socket open
+
+        Returns:
+            the copy of the socket, for another process to take over
+        """
+        # data the stream read ahead is kept as unread data
+        self.writer.transport.pause_reading()
+        self.reader.feed_eof()
+        self.feed(await self.reader.read())
+
+        sock = socket.socket(fileno=os.dup(self.writer.get_extra_info("socket").fileno()))
+        self.closing = True
+        self.ready.set()
+        await self.write_task
+        return sock
+
+class AsyncRoomSignal:
+    """
+    Wakes the tasks waiting on a change to a room's state, the event loop equivalent of
+    server.RoomSignal
+    The event is only made once a task waits, as most rooms are idle at any time
+    Holding it does nothing, as the event loop only runs one task at a time
+    """
+    __slots__ = ("event",)
+
+    def __init__(self) -> None:
+        self.event = None
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def notify(self) -> None:
+        """
+        Wakes all waiting tasks to recheck their condition
+        """
+        if self.event:
+            self.event.set()
+            self.event = None
+
+    async def wait_for(self, predicate) -> None:
+        """
+        Waits until predicate() is true, rechecking each time the room changes
+        """
+        while not predicate():
+            if not self.event:
+                self.event = asyncio.Event()
+            await self.event.wait()
+
+async def begin(client: StreamClient, room_name: str) -> list[str]:
+    """
+    Handles in room client commands, the event loop equivalent of server.begin()
+
+    Args:
+        client (StreamClient): the client in the room
+        room_name (str): holds name of room that is being handled
+
+    Returns:
+        message received after the game ended, to be handled as an out of game command
+    """
+    room = server.rooms[room_name]
+    while True:
+        player_move = await client.recv_msg()
+        if player_move[0] == "":
+            raise OSError
+
+        # viewers that missed a move are sent the game again straight away
+        if player_move[0] == "RESYNC" and server.rooms.get(room_name) is room:
+            client.sendall(server.snapshot_msg(room).encode())
+            continue
+
+        # hold move if game not begun or not turn
+        await room.signal.wait_for(lambda: server.may_move(client, room_name, room))
+
+        # if game is over use this input as out of game input
+        if server.rooms.get(room_name) is not room:
+            server.leave_room(client)
+            return player_move
+        if not server.in_room(client, room):
+            raise OSError
+
+        start = time.perf_counter()
+        game_over = server.play_move(client, room_name, player_move)
+        metrics.observe("move", server.command_name(player_move), time.perf_counter() - start)
+        if game_over:
+            server.leave_room(client)
+            return []
+
+async def hand_off(client: StreamClient, msg_recv: list[str], worker: int,
+                   resume_hops: int) -> None:
+    """
+    Passes a client and the command it sent to another worker, the event loop equivalent
+    of server.hand_off()
+    """
+    sock = await client.detach()
+    state = server.export_client(client, msg_recv, resume_hops)
+    try:
+        await asyncio.to_thread(cluster.send_request, worker, state, sock.fileno())
+        metrics.count("handoffs")
+    finally:
+        sock.close()
+
+async def adopt(sock: socket.socket, state: dict) -> None:
+    """
+    Takes over a client handed over by another worker
+    """
+    reader, writer = await asyncio.open_connection(sock=sock)
+    await handle_client(reader, writer, state)
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        state: dict = None) -> None:
+    """
+    Get client messages and runs the server's appropriate function, the event loop
+    equivalent of server.handle_client()
+    """
+    client = StreamClient(reader, writer)
+    server.watch_client(client)
+    client_address = writer.get_extra_info("peername")
+    server.connection_log.info("Client connected: %s", client_address)
+    msg_recv = server.restore_client(client, state) if state else []
+    resume_hops = state["resume_hops"] if state else 0
+
+    try:
+        while True:
+            # Recieve message and run appropriate function
+            if not msg_recv:
+                msg_recv = await client.recv_msg()
+            server.command_log.debug("Received data: %s", msg_recv)
+
+            # commands for rooms owned by another worker are handled by it
+            worker = server.route(client, msg_recv, resume_hops)
+            if worker >= 0:
+                await hand_off(client, msg_recv, worker, resume_hops)
+                server.cluster_log.info("Client handed to worker %d: %s", worker, client_address)
+                return
+            resume_hops = 0
+
+            if msg_recv[0] in BLOCKING_COMMANDS or \
+(msg_recv[0] in CLUSTER_COMMANDS and cluster.count > 1):
+                await asyncio.to_thread(server.dispatch, client, msg_recv)
+            else:
+                server.dispatch(client, msg_recv)
+            if msg_recv[0] in BLOCKING_COMMANDS:
+                server.hash_log.info("Hash pool: %s", server.hasher.stats())
+
+            # the message that escaped a finished game is handled next
+            msg_recv = []
+            room_name = server.current_room(client)
+            if room_name:
+                msg_recv = await begin(client, room_name)
+
+    except OSError:
+        server.disconnect(client)
+        client.close()
+        server.connection_log.info("Client disconnected: %s", client_address)
+    # the server is stopping, the client is left in their room for the snapshot
+    except asyncio.CancelledError:
+        pass
+
+async def turn_timers() -> None:
+    """
+    Turns the server's timer wheel once each tick, so timers are called on the event
+    loop rather than by a thread of their own
+    """
+    wheel = timers.wheel
+    while True:
+        await asyncio.sleep(wheel.tick - time.monotonic() % wheel.tick)
+        wheel.advance(time.monotonic())
+
+def raise_file_limit() -> None:
+    """
+    Raises the open file limit as far as allowed, as each connection holds a descriptor
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+async def serve(port: int) -> None:
+    """
+    Accepts clients on the port, handling all of them on the one event loop
+
+    Args:
+        port (int): the port to listen on
+    """
+    # enough threads to wait on every job the hash pool accepts, so logins past its
+    # queue size reach it and are refused straight away
+    threads = server.hasher.capacity + 8
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(threads))
+    loop = asyncio.get_running_loop()
+    timer_task = loop.create_task(turn_timers()) # held so the task is not collected
+    metrics.gauge("tasks", lambda: len(asyncio.all_tasks(loop)))
+    server.adopt_client = lambda sock, state: \
+loop.call_soon_threadsafe(loop.create_task, adopt(sock, state))
+    # quickplay queue changes are sent by one thread, so they reach the first worker in
+    # the order they were made
+    quickplay_sender = ThreadPoolExecutor(1)
+    send_quickplay = server.send_quickplay
+    server.send_quickplay = lambda request: quickplay_sender.submit(send_quickplay, request)
+    # workers each listen on the port and the kernel shares clients out
+    listener = await asyncio.start_server(handle_client, "", port, reuse_address=True,
+                                          reuse_port=cluster.count > 1,
+                                          backlog=socket.SOMAXCONN)
+    async with listener:
+        await listener.serve_forever()
+
+def main(config: dict) -> None:
+    """
+    Sets up server and runs the event loop until ctrl c
+
+    Args:
+        config (dict): the loaded server config
+    """
+    # set first, as rooms restored on setup are given their signals
+    server.room_signal = AsyncRoomSignal
+    server.setup(config)
+    raise_file_limit()
+
+    try:
+        asyncio.run(serve(config["port"]))
+    # If waiting for client and ctrl c - quit cleanly
+    except KeyboardInterrupt:
+        print("\nClosing server...")
+        server.drain(False)
+        server.hasher.shutdown()
+        history.stop()
+        server.users.flush()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main(server.read_json(sys.argv[1]))
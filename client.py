@@ -1,16 +1,22 @@
 # imports
 import sys
+import math
+import time
 import socket
+import protocol
 
 # constants and globals
-MAX_MSG_SZ = 8192 # max size in bytes of mesg received
+ROOM_PAGE_SIZE = 20 # room names shown at a time
+RECONNECT_ATTEMPTS = 30 # times to try reconnecting, once a second, as the server may be
+                        # restarting
 user = "" # holds the users name once logged in
+token = "" # holds the session token once logged in, used to resume after a dropped connection
 
 """
 All of the following functions use one or more of these args
 
 Args:
-    client_socket (socket.socket): The socket object for connecting to the server  
+    client_socket (protocol.SocketConnection): The connection to the server
     msg_type (str): The keyword for that message type (e.g. LOGIN, PLACE)
 """
 def exit_server(client_socket: socket.socket, msg_type: str) -> None:
@@ -57,16 +63,23 @@ def login(client_socket: socket.socket, msg_type: str) -> None:
     Creates login message to send to the server, then handles server response  
     """
     username = user_data_request(client_socket, msg_type)
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
+    msg_recv = client_socket.recv_msg()
 
     if msg_recv[2] == '0':
-        global user
+        global user, token
         user = username
+        token = msg_recv[3]
         print(f"Welcome {username}")
+        # returned to the game the user was in before the server restarted
+        if len(msg_recv) == 5:
+            print("Returning to your game in room " + msg_recv[4])
+            rejoin(client_socket)
     elif msg_recv[2] == '1':
         print(f"Error: User {username} not found", file=sys.stderr)
     elif msg_recv[2] == '2':
         print(f"Error: Wrong password for user {username}", file=sys.stderr)
+    elif msg_recv[2] == '4':
+        print("Error: Server is busy, please try again later", file=sys.stderr)
 
 def register(client_socket: socket.socket, msg_type: str) -> None:
     """
@@ -74,12 +87,14 @@ def register(client_socket: socket.socket, msg_type: str) -> None:
     """
     username = user_data_request(client_socket, msg_type)
 
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
+    msg_recv = client_socket.recv_msg()
 
     if msg_recv[2] == '0':
         print(f"Successfully created user account {username}")
     elif msg_recv[2] == '1':
         print(f"Error: User {username} already exists", file=sys.stderr)
+    elif msg_recv[2] == '3':
+        print("Error: Server is busy, please try again later", file=sys.stderr)
 
 def create(client_socket: socket.socket, msg_type: str) -> None:
     """
@@ -87,9 +102,13 @@ def create(client_socket: socket.socket, msg_type: str) -> None:
     """
     room_name = input("Enter room name you want to create: ")
     msg = msg_type + ':' + room_name
+    variant = input("Enter board size and win length (e.g. 15 5), AI to play the server, \
+or leave blank for 3x3: ")
+    if variant.split():
+        msg += ':' + ':'.join(variant.split())
 
     client_socket.sendall(msg.encode())
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
+    msg_recv = client_socket.recv_msg()
 
     if msg_recv[0] == "BADAUTH":
         badauth()
@@ -97,14 +116,18 @@ def create(client_socket: socket.socket, msg_type: str) -> None:
 
     if msg_recv[2] == '0':
         print(f"Successfully created room {room_name}")
-        print("Waiting for second player")
+        if variant.strip() != "AI":
+            print("Waiting for second player")
         begin(client_socket, '')
     elif msg_recv[2] == '1':
         print(f"Error: Room {room_name} is invalid", file=sys.stderr)
     elif msg_recv[2] == '2':
         print(f"Error: Room {room_name} already exists", file=sys.stderr)
     elif msg_recv[2] == '3':
-        print("Error: Server already contains a maximum of 256 rooms", file=sys.stderr)
+        print("Error: Server already contains the maximum number of rooms", file=sys.stderr)
+    elif msg_recv[2] == '4':
+        print("Error: Board size and win length must be numbers, with the win length at least \
+3 and at most the board size, or AI", file=sys.stderr)
 
 def get_mode() -> str:
     """
@@ -125,23 +148,34 @@ def get_mode() -> str:
 
 def roomlist(client_socket: socket.socket, msg_type: str) -> None:
     """ 
-    Creates roomlist message to send to the server, then handles server response
+    Creates roomlist messages to send to the server, then handles server responses
+    Rooms are fetched a page at a time, for as long as the user wants more
     """
     # ensuring correct input
     mode = get_mode()
-    msg = msg_type + ':' + mode
+    prefix = input("Enter the start of the room name to search for (blank for all): ")
+    cursor = ""
 
-    client_socket.sendall(msg.encode())
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
+    while True:
+        msg = msg_type + ':' + mode + ':' + prefix + ':' + str(ROOM_PAGE_SIZE)
+        if cursor:
+            msg += ':' + cursor
 
-    if msg_recv[0] == "BADAUTH":
-        badauth()
-        return
+        client_socket.sendall(msg.encode())
+        msg_recv = client_socket.recv_msg()
+
+        if msg_recv[0] == "BADAUTH":
+            badauth()
+            return
+
+        if msg_recv[2] == '1':
+            print("Error: Please input a valid mode.", file=sys.stderr)
+            return
 
-    if msg_recv[2] == '0':
         print(f"Room available to join as {mode}: {msg_recv[3]}")
-    elif msg_recv[2] == '1':
-        print("Error: Please input a valid mode.", file=sys.stderr)
+        cursor = msg_recv[4]
+        if not cursor or input("Show more rooms? (y/n) ").lower() != 'y':
+            return
 
 def join(client_socket: socket.socket, msg_type: str) -> None:
     """
@@ -151,15 +185,12 @@ def join(client_socket: socket.socket, msg_type: str) -> None:
     mode = get_mode()
 
     msg = msg_type + ':' + room_name + ':' + mode
+    # viewers are sent each move rather than the whole board
+    if mode == "VIEWER":
+        msg += ":STREAM"
 
     client_socket.sendall(msg.encode())
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split('\n')
-
-    # in case both messages are sent to client in quick succession
-    begin_msg = ''
-    if len(msg_recv) > 1:
-        begin_msg = msg_recv[1]
-    msg_recv = msg_recv[0].split(':')
+    msg_recv = client_socket.recv_msg()
 
     if msg_recv[0] == "BADAUTH":
         badauth()
@@ -167,31 +198,120 @@ def join(client_socket: socket.socket, msg_type: str) -> None:
 
     if msg_recv[2] == '0':
         print(f"Successfully joined room {room_name} as a {mode}")
-        begin(client_socket, begin_msg)
+        begin(client_socket)
     elif msg_recv[2] == '1':
         print(f"Error: No room named {room_name}", file=sys.stderr)
     elif msg_recv[2] == '2':
         print(f"Error: The room {room_name} already has 2 players")
 
-def col_row_check(axis_name: str) -> str:
+def quickplay(client_socket: socket.socket, msg_type: str) -> None:
+    """
+    Asks the server for a game against the next player looking for one, then handles
+    server response
+    """
+    client_socket.sendall(msg_type.encode())
+    msg_recv = client_socket.recv_msg()
+
+    if msg_recv[0] == "BADAUTH":
+        badauth()
+        return
+
+    if msg_recv[2] == '0':
+        print(f"Joined the queue in room {msg_recv[3]}, waiting for an opponent")
+        begin(client_socket)
+    elif msg_recv[2] == '1':
+        print("Error: Server already contains the maximum number of rooms", file=sys.stderr)
+
+def stats(client_socket: socket.socket, msg_type: str) -> None:
+    """
+    Asks the server for a player's results and rank, or for its metrics if no player is
+    given, which only admins may see, then prints them
+    """
+    username = input("Enter username to see their results (blank for server metrics): ")
+    msg = msg_type + (':' + username if username else "")
+
+    client_socket.sendall(msg.encode())
+    msg_recv = client_socket.recv_msg()
+
+    if msg_recv[0] == "BADAUTH":
+        badauth()
+        return
+
+    if msg_recv[2] == '0' and username:
+        rank = f"rank {msg_recv[8]}" if msg_recv[8] else "unranked"
+        print(f"{msg_recv[3]}: {msg_recv[4]} wins, {msg_recv[5]} losses, {msg_recv[6]} draws, "
+              f"{msg_recv[7]} forfeits, {rank}")
+    elif msg_recv[2] == '0':
+        for metric in msg_recv[3].split(','):
+            print(metric.replace('=', ': '))
+    elif msg_recv[2] == '1':
+        print("Error: Only admins can see the server's metrics", file=sys.stderr)
+    elif msg_recv[2] == '3':
+        print(f"Error: No user named {username}", file=sys.stderr)
+
+def leaderboard(client_socket: socket.socket, msg_type: str) -> None:
+    """
+    Asks the server for its best players, then prints them with their results
+    """
+    count = input("Enter how many players to show (blank for 10): ")
+    msg = msg_type + (':' + count if count else "")
+
+    client_socket.sendall(msg.encode())
+    msg_recv = client_socket.recv_msg()
+
+    if msg_recv[0] == "BADAUTH":
+        badauth()
+        return
+
+    if msg_recv[2] == '1':
+        print("Error: Please input a number of players from 1 to 100", file=sys.stderr)
+        return
+
+    if not msg_recv[3]:
+        print("No games have been played yet")
+        return
+
+    for rank, player in enumerate(msg_recv[3].split(','), 1):
+        username, wins, losses, draws, forfeits = player.split('/')
+        print(f"{rank}. {username}: {wins} wins, {losses} losses, {draws} draws, "
+              f"{forfeits} forfeits")
+
+def debug(client_socket: socket.socket, msg_type: str) -> None:
+    """
+    Asks the server to write its room table to its log, which only admins may do
+    """
+    client_socket.sendall((msg_type + ":ROOMS").encode())
+    msg_recv = client_socket.recv_msg()
+
+    if msg_recv[0] == "BADAUTH":
+        badauth()
+        return
+
+    if msg_recv[2] == '0':
+        print(f"The server logged its {msg_recv[3]} rooms")
+    elif msg_recv[2] == '1':
+        print("Error: Only admins can dump the server's rooms", file=sys.stderr)
+
+def col_row_check(axis_name: str, size: int = 3) -> str:
     """
     Get valid col or row input
 
     Args:
         axis_name (str): the name of the axis being inputted (col/row)
+        size (int): the number of rows and columns on the board
 
     Returns:
         valid axis input as string
     """
     axis = -1
-    while axis < 0 or axis > 2:
+    while axis < 0 or axis > size - 1:
         axis = input(axis_name + ": ")
         try:
             axis = int(axis)
-            if axis < 0 or axis > 2:
+            if axis < 0 or axis > size - 1:
                 raise Exception
         except Exception:
-            print(axis_name + " values must be an integer between 0 and 2")
+            print(axis_name + f" values must be an integer between 0 and {size - 1}")
             axis = -1
     return str(axis)
 
@@ -202,7 +322,7 @@ Args:
     board (str): holds 0s, 1s or 2s for blank spot X and O respectively for each space
                  on the board from left to right, top to bottom
 """
-def place(client_socket: socket.socket, msg_type: str, board: str) -> str:
+def place(client_socket: socket.socket, msg_type: str, board: str) -> list[str]:
     """
     Gets valid position for player's move and sends to server
 
@@ -211,10 +331,11 @@ def place(client_socket: socket.socket, msg_type: str, board: str) -> str:
     """
     valid_space = False
     markers = [' ', 'X', 'O']
+    size = math.isqrt(len(board))
     while not valid_space:
-        col = col_row_check("Column")
-        row = col_row_check("Row")
-        spot_val = board[3  * int(row) + int(col)]
+        col = col_row_check("Column", size)
+        row = col_row_check("Row", size)
+        spot_val = board[size * int(row) + int(col)]
         if spot_val == '0':
             valid_space = True
         else:
@@ -223,10 +344,9 @@ def place(client_socket: socket.socket, msg_type: str, board: str) -> str:
     msg = msg_type + ':' + col + ':' + row
 
     client_socket.sendall(msg.encode())
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split('\n')
-    return msg_recv
+    return client_socket.recv_msg()
 
-def forfeit(client_socket: socket.socket, msg_type: str, board: str) -> str:
+def forfeit(client_socket: socket.socket, msg_type: str, board: str) -> list[str]:
     """
     Sends forfeit message
 
@@ -234,8 +354,7 @@ def forfeit(client_socket: socket.socket, msg_type: str, board: str) -> str:
         Message recieved from server in response
     """
     client_socket.sendall(msg_type.encode())
-    msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split('\n')
-    return msg_recv
+    return client_socket.recv_msg()
 
 def print_board(board: str) -> None:
     """
@@ -246,71 +365,87 @@ def print_board(board: str) -> None:
         '1': 'X',
         '2': 'O'
         }
+    size = math.isqrt(len(board))
 
     for index, num in enumerate(board):
-        if index % 3 == 0:
-            print("\n-------------")
+        if index % size == 0:
+            print("\n" + '-' * (4 * size + 1))
             print("|", end=' ')
 
         print(num_to_sym[num], end= ' | ')
-    print("\n-------------\n")
+    print("\n" + '-' * (4 * size + 1) + "\n")
 
-def begin(client_socket: socket.socket, begin_msg: str) -> None:
+def begin(client_socket: socket.socket, msg_recv: list[str] = None,
+          board: str = "000000000", turn: int = -1) -> None:
     """
     Handles in room player commands, receiving player input only when it is their turn
     Also handles server sent messages in reponse to player inputs
+    A game being resumed is given its in progress message and current board, which the
+    turn is counted from unless given
+    Viewers are sent a snapshot of the game then each move, asking for the snapshot
+    again if they find a move is missing
     """
     msg_to_func = {
         "PLACE": place,
         "FORFEIT": forfeit,
     }
-    # handling if begin message was joined with previous
-    if not begin_msg:
-        msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
-    else:
-        msg_recv = begin_msg.strip().split(':')
+    if not msg_recv:
+        msg_recv = client_socket.recv_msg()
+
+    # rooms that are not 3x3 send their board size and win length
+    if len(msg_recv) == 5 and len(board) != int(msg_recv[3]) ** 2:
+        board = '0' * int(msg_recv[3]) ** 2
+        print(f"Playing on a {msg_recv[3]}x{msg_recv[3]} board, \
+{msg_recv[4]} in a row wins")
 
     # send appropriate message upon joining a room that has now/was begun
+    if turn < 0:
+        turn = len(board) - board.count('0')
     if msg_recv[0] == "BEGIN":
         print(f"Match between {msg_recv[1]} and {msg_recv[2]} will commence, \
 it is currently {msg_recv[1]}'s turn")
-        board = "000000000"
         print_board(board)
     elif msg_recv[0] == "INPROGRESS":
         print(f"Match between {msg_recv[1]} and {msg_recv[2]} is currently in progress, \
-it is {msg_recv[1]}'s turn")
+it is {msg_recv[turn % 2 + 1]}'s turn")
+    resyncing = False # whether moves are ignored until the snapshot asked for arrives
 
-    turn = 0
-    double_recv_msg = ""
     while True:
         try:
             # if turn can send message
             if msg_recv[turn % 2 + 1] == user:
                 user_msg = input("Your turn:\n")
-                if double_recv_msg: # if double status recieved, handle
-                    board_status = double_recv_msg
-                    double_recv_msg = ""
-                else:
-                    board_status = msg_to_func[user_msg](client_socket, user_msg, board)
+                board_status = msg_to_func[user_msg](client_socket, user_msg, board)
             # if not turn or viewer
             else:
                 if user in msg_recv:
                     print("Wait for your turn") # change later
                 else:
                     print(f"{msg_recv[turn % 2 + 1]}'s turn")
-                if double_recv_msg:
-                    board_status = double_recv_msg
-                    double_recv_msg = ""
-                else:
-                    board_status = client_socket.recv(MAX_MSG_SZ).decode().strip().split('\n')
+                board_status = client_socket.recv_msg()
 
             # handling recieved server message
-            if len(board_status) == 2:
-                double_recv_msg = board_status[1].split(':')
-            board_status = board_status[0].split(':')
-
             if board_status[0] == "BOARDSTATUS":
                 board = board_status[1]
+                # counted from the board, as viewers that fall behind may skip boards
+                turn = len(board) - board.count('0')
+                print_board(board)
+
+            elif board_status[0] == "SNAPSHOT":
+                board = board_status[3]
+                turn = int(board_status[1])
+                resyncing = False
+                print_board(board)
+
+            elif board_status[0] == "MOVE" and not resyncing:
+                # moves are numbered, so a missing one means the board is out of date
+                if int(board_status[1]) != turn + 1:
+                    client_socket.sendall("RESYNC".encode())
+                    resyncing = True
+                    continue
+                cell = int(board_status[2])
+                board = board[:cell] + str(turn % 2 + 1) + board[cell + 1:]
+                turn += 1
                 print_board(board)
 
             elif board_status[0] == "GAMEEND":
@@ -328,7 +463,6 @@ it is {msg_recv[1]}'s turn")
                 elif board_status[2] == '2':
                     print(f"{board_status[3]} won due to the opposing player forfeiting")
                 break
-            turn += 1
 
         # if user enters a non-command
         except KeyError:
@@ -343,6 +477,78 @@ it is {msg_recv[1]}'s turn")
             print("Unknown message received from server. Exiting...")
             exit_server(client_socket, "QUIT")
 
+def connect(server_address: tuple[str, int]) -> protocol.SocketConnection:
+    """
+    Opens a connection to the server, switching it to the binary protocol
+
+    Args:
+        server_address (tuple[str, int]): holds [0] ip of server [1] server port
+
+    Returns:
+        the connection
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(server_address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client_socket = protocol.SocketConnection(sock)
+    # room lists and leaderboards from the server may be longer than a client's messages
+    client_socket.max_length = 0
+
+    client_socket.sendall(f"HELLO:{protocol.BINARY_VERSION}".encode())
+    msg_recv = client_socket.recv_msg()
+    # the acknowledgement is the last message sent in the legacy protocol
+    if msg_recv[:3] == ["HELLO", "ACKSTATUS", '0']:
+        client_socket.version = protocol.BINARY_VERSION
+    return client_socket
+
+def rejoin(client_socket: socket.socket) -> None:
+    """
+    Returns to the game the user was in, from the in progress message and the board
+    that follow the acknowledgement, streaming viewers being sent a snapshot instead
+    """
+    begin_msg = client_socket.recv_msg()
+    state = client_socket.recv_msg()
+    # holds [1] number of moves made [2] seat to move [3] board
+    if state[0] == "SNAPSHOT":
+        begin(client_socket, begin_msg, state[3], int(state[1]))
+    else:
+        begin(client_socket, begin_msg, state[1])
+
+def resume(server_address: tuple[str, int]) -> protocol.SocketConnection:
+    """
+    Reconnects after the connection to the server drops, resuming the logged in session
+    and returning to the game the user was in, if any
+    Connecting is retried for RECONNECT_ATTEMPTS seconds, in case the server restarts
+
+    Args:
+        server_address (tuple[str, int]): holds [0] ip of server [1] server port
+
+    Returns:
+        the new connection
+    """
+    for attempt in range(RECONNECT_ATTEMPTS):
+        try:
+            client_socket = connect(server_address)
+            break
+        except OSError:
+            if attempt == RECONNECT_ATTEMPTS - 1:
+                raise
+            time.sleep(1)
+    if not token:
+        return client_socket
+
+    client_socket.sendall(("RESUME:" + token).encode())
+    msg_recv = client_socket.recv_msg()
+    if msg_recv[2] != '0':
+        print("Error: Session expired, please log in again", file=sys.stderr)
+        return client_socket
+
+    print("Reconnected to server")
+    # returned to a game in progress, its room is named and its state follows
+    if len(msg_recv) == 4:
+        rejoin(client_socket)
+    return client_socket
+
 def main(args: list[str]) -> None:
     """
     Get user input and run appropriate function in order to recieve data to send to server
@@ -358,14 +564,16 @@ def main(args: list[str]) -> None:
         "REGISTER": register,
         "CREATE": create,
         "ROOMLIST": roomlist,
-        "JOIN": join
+        "JOIN": join,
+        "QUICKPLAY": quickplay,
+        "STATS": stats,
+        "LEADERBOARD": leaderboard,
+        "DEBUG": debug
     }
 
     # set up server connection
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_address = (args[0], int(args[1]))
-    client_socket.connect(server_address)
-    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client_socket = connect(server_address)
 
     while True:
         try:
@@ -389,5 +597,11 @@ def main(args: list[str]) -> None:
             print("Unknown message received from server. Exiting...")
             exit_server(client_socket, "QUIT")
 
+        # if connection to the server dropped, pick up where the user left off
+        except (OSError, IndexError):
+            print("Connection lost, reconnecting...")
+            client_socket.close()
+            client_socket = resume(server_address)
+
 if __name__ == "__main__":
     main(sys.argv[1:])
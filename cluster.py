@@ -0,0 +1,223 @@
+# imports
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import traceback
+import logs
+
+# constants and globals
+MAX_REQUEST_SZ = 65536
+RESTART_DELAY = 1 # seconds before restarting a worker that exited unexpectedly
+index = 0 # index of this worker
+count = 1 # number of workers, 1 when not running as a cluster
+socket_dir = "" # directory holding each worker's routing socket
+router = None # this worker's listening routing socket
+stopping = False # whether this worker has been told to stop
+log = logs.get("cluster")
+
+"""
+Workers each accept clients on the shared port, and each room is owned by exactly one of
+them, chosen by the room's name. Clients creating or joining a room owned by another
+worker are handed over to it along with their connection, so all of a room's players and
+viewers are in the one process. Workers ask each other for their rooms over the same
+routing sockets
+
+All of the following functions use one or more of these args
+
+Args:
+    worker (int): the index of a worker
+    request (dict): a request to another worker, its kind plus any arguments
+"""
+def socket_path(worker: int) -> str:
+    """
+    Returns:
+        path of the worker's routing socket
+    """
+    return os.path.join(socket_dir, f"worker{worker}.sock")
+
+def owner(room_name: str) -> int:
+    """
+    Finds the worker that owns a room
+
+    Returns:
+        index of the owning worker
+    """
+    return zlib.crc32(room_name.encode()) % count
+
+def read_all(sock: socket.socket) -> bytes:
+    """
+    Reads from sock until the other end stops sending
+
+    Returns:
+        data read
+    """
+    data = bytearray()
+    chunk = sock.recv(MAX_REQUEST_SZ)
+    while chunk:
+        data += chunk
+        chunk = sock.recv(MAX_REQUEST_SZ)
+    return bytes(data)
+
+def send_request(worker: int, request: dict, fd: int = -1) -> dict:
+    """
+    Sends a request to a worker and waits for its reply
+
+    Args:
+        fd (int): a file descriptor to pass to the worker, if any
+
+    Returns:
+        the worker's reply
+
+    Raises:
+        OSError: if the worker could not be reached
+    """
+    data = json.dumps(request).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path(worker))
+        sent = socket.send_fds(sock, [data], [fd]) if fd >= 0 else 0
+        sock.sendall(data[sent:])
+        sock.shutdown(socket.SHUT_WR)
+        reply = read_all(sock)
+    return json.loads(reply) if reply else {}
+
+def ask_all(request: dict) -> list[dict]:
+    """
+    Sends a request to every other worker, skipping any that can not be reached
+
+    Returns:
+        the replies received
+    """
+    replies = []
+    for worker in range(count):
+        if worker == index:
+            continue
+        try:
+            replies.append(send_request(worker, request))
+        except (OSError, ValueError) as e:
+            log.warning("Worker %d did not answer: %s", worker, e)
+    return replies
+
+def serve(handlers: dict) -> None:
+    """
+    Answers requests from the other workers in a thread of its own
+
+    Args:
+        handlers (dict): key - request kind : value - function taking the request and any
+                         file descriptors passed with it, returning the reply
+    """
+    def answer() -> None:
+        while True:
+            conn, _ = router.accept()
+            with conn:
+                try:
+                    data, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SZ, 1)
+                    request = json.loads(data + read_all(conn))
+                    reply = handlers[request["kind"]](request, fds)
+                    conn.sendall(json.dumps(reply).encode())
+                except (OSError, ValueError, KeyError) as e:
+                    log.warning("Bad request from another worker: %s", e)
+
+    threading.Thread(target=answer, daemon=True).start()
+
+def stop_worker(signum: int, frame) -> None:
+    """
+    Stops a worker on ctrl c, or when the supervisor sends SIGTERM, by raising
+    KeyboardInterrupt as ctrl c does, so the worker saves its rooms and closes as it
+    would on its own
+    Ctrl c reaches the supervisor and every worker at once, so any signal after the first
+    is ignored rather than interrupting the worker while it saves
+    """
+    global stopping
+    if not stopping:
+        stopping = True
+        raise KeyboardInterrupt
+
+def start_worker(worker: int, listeners: list[socket.socket], run_worker) -> int:
+    """
+    Forks a worker process, which runs run_worker() then exits
+
+    Args:
+        listeners (list[socket.socket]): every worker's listening routing socket
+
+    Returns:
+        the worker's process id
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+
+    global index, router
+    index = worker
+    router = listeners[worker]
+    for listener in listeners:
+        if listener is not router:
+            listener.close()
+    signal.signal(signal.SIGINT, stop_worker)
+    signal.signal(signal.SIGTERM, stop_worker)
+
+    code = 0
+    try:
+        run_worker()
+    except SystemExit as e:
+        code = e.code or 0
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    # writes any log records still queued, as exiting this way skips the usual cleanup
+    logging.shutdown()
+    sys.stdout.flush()
+    os._exit(code)
+
+def supervise(workers: int, run_worker) -> None:
+    """
+    Runs run_worker() in each of a number of worker processes, restarting any that exit
+    unexpectedly, until ctrl c
+    Must be called before any threads are started, as forking only copies the calling one
+
+    Args:
+        workers (int): number of worker processes
+        run_worker: function that runs the server in a worker
+    """
+    global count, socket_dir
+    count = workers
+    socket_dir = tempfile.mkdtemp(prefix="tictactoe-")
+
+    # bound before forking, so every worker can reach every other as soon as it starts
+    listeners = []
+    for worker in range(workers):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path(worker))
+        listener.listen(socket.SOMAXCONN)
+        listeners.append(listener)
+
+    pids = {} # key - process id : value - worker index
+    try:
+        for worker in range(workers):
+            pids[start_worker(worker, listeners, run_worker)] = worker
+        while True:
+            pid, status = os.wait()
+            worker = pids.pop(pid)
+            log.warning("Worker %d exited with status %d, restarting", worker, status)
+            time.sleep(RESTART_DELAY)
+            pids[start_worker(worker, listeners, run_worker)] = worker
+
+    # If waiting for workers and ctrl c - quit cleanly, waiting for each worker to save
+    # its rooms
+    except KeyboardInterrupt:
+        print("\nClosing server...")
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
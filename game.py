@@ -8,12 +8,20 @@ __all__ = [
     "print_board", 
     "player_turn", 
     "player_wins", 
-    "players_draw"
+    "players_draw",
+    "create_bitboards",
+    "place",
+    "is_occupied",
+    "bitboard_wins",
+    "bitboards_draw",
+    "wins_through",
+    "board_status"
 ]
 __author__ = "Luca Napoli"
 
 
 BOARD_SIZE = 3
+MAX_BOARD_SIZE = 19
 CELL_SIZE = 5
 
 ROW_SEPARATOR = '-'
@@ -25,25 +33,35 @@ CROSS = 'X'
 EMPTY = ' '
 
 Board = list[list[str]]
+Bitboards = list[int] # [crosses, noughts], bit size * row + col is set if they
+                      # hold that cell
+LINE_DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
 
-def _player_wins_vertically(player: str, board: Board) -> bool:
-    return any(
-        all(board[y][x] == player for y in range(BOARD_SIZE)) 
-        for x in range(BOARD_SIZE)
-    )
 
+def _cell_bit(col: int, row: int, size: int = BOARD_SIZE) -> int:
+    return 1 << (size * row + col)
 
-def _player_wins_horizontally(player: str, board: Board) -> bool:
-    return any(
-        all(board[x][y] == player for y in range(BOARD_SIZE)) 
-        for x in range(BOARD_SIZE)
+
+def _win_masks() -> tuple[int, ...]:
+    lines = (
+        [[(x, y) for x in range(BOARD_SIZE)] for y in range(BOARD_SIZE)] +
+        [[(x, y) for y in range(BOARD_SIZE)] for x in range(BOARD_SIZE)] +
+        [[(y, y) for y in range(BOARD_SIZE)]] +
+        [[(y, BOARD_SIZE - 1 - y) for y in range(BOARD_SIZE)]]
     )
+    return tuple(sum(_cell_bit(x, y) for x, y in line) for line in lines)
+
+
+WIN_MASKS = _win_masks()
+PLAYERS = (CROSS, NOUGHT)
 
 
-def _player_wins_diagonally(player: str, board: Board) -> bool:
-    return (
-        all(board[y][y] == player for y in range(BOARD_SIZE)) or
-        all(board[BOARD_SIZE - 1 - y][y] == player for y in range(BOARD_SIZE))
+def _board_to_bitboard(player: str, board: Board) -> int:
+    return sum(
+        _cell_bit(x, y)
+        for y in range(BOARD_SIZE)
+        for x in range(BOARD_SIZE)
+        if board[y][x] == player
     )
 
 
@@ -78,17 +96,65 @@ def player_turn(player: str, board: Board, col: int, row: int) -> tuple[int, int
 
 def player_wins(player: str, board: Board) -> bool:
     """Determines whether the specified player wins given the board"""
-    return (
-        _player_wins_vertically(player, board) or
-        _player_wins_horizontally(player, board) or
-        _player_wins_diagonally(player, board)
-    )
+    return bitboard_wins(_board_to_bitboard(player, board))
 
 
 def players_draw(board: Board) -> bool:
     """Determines whether the players draw on the given board"""
-    return all(
-        board[y][x] != EMPTY 
-        for y in range(BOARD_SIZE) 
-        for x in range(BOARD_SIZE)
-    )
+    return bitboards_draw([_board_to_bitboard(player, board) for player in PLAYERS])
+
+
+def create_bitboards() -> Bitboards:
+    """Create a new empty board as bitboards"""
+    return [0, 0]
+
+
+def place(
+    bitboards: Bitboards, player_index: int, col: int, row: int, size: int = BOARD_SIZE
+) -> int:
+    """Does a player's turn, given as 0 for crosses and 1 for noughts, on the bitboards
+    and returns the bitboard of that player"""
+    bitboards[player_index] |= _cell_bit(col, row, size)
+    return bitboards[player_index]
+
+
+def is_occupied(bitboards: Bitboards, col: int, row: int, size: int = BOARD_SIZE) -> bool:
+    """Determines whether either player holds the cell"""
+    return bool((bitboards[0] | bitboards[1]) & _cell_bit(col, row, size))
+
+
+def bitboard_wins(bitboard: int) -> bool:
+    """Determines whether a player's bitboard holds a full line"""
+    return any(bitboard & mask == mask for mask in WIN_MASKS)
+
+
+def bitboards_draw(bitboards: Bitboards, size: int = BOARD_SIZE) -> bool:
+    """Determines whether every cell of the bitboards is taken"""
+    return bitboards[0] | bitboards[1] == (1 << size * size) - 1
+
+
+def wins_through(
+    bitboard: int, col: int, row: int, size: int = BOARD_SIZE, win_length: int = BOARD_SIZE
+) -> bool:
+    """Determines whether the stone at (col, row) completes a line of win_length for the
+    player, only checking the lines through that stone"""
+    for dx, dy in LINE_DIRECTIONS:
+        count = 1
+        for step in (1, -1):
+            x, y = col + dx * step, row + dy * step
+            while 0 <= x < size and 0 <= y < size and bitboard >> (size * y + x) & 1:
+                count += 1
+                if count >= win_length:
+                    return True
+                x, y = x + dx * step, y + dy * step
+    return False
+
+
+def board_status(bitboards: Bitboards, size: int = BOARD_SIZE) -> str:
+    """Encodes the bitboards as 0s, 1s or 2s for blank, X and O respectively for each
+    cell, from left to right, top to bottom"""
+    n_cells = size * size
+    # read as decimal, each player's cells are digits that can be added without carrying
+    crosses = format(bitboards[0], f"0{n_cells}b")[::-1]
+    noughts = format(bitboards[1], f"0{n_cells}b")[::-1]
+    return str(int(crosses) + 2 * int(noughts)).zfill(n_cells)
@@ -0,0 +1,179 @@
+# imports
+import time
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+class PoolBusy(Exception):
+    """
+    Raised when the pool already holds as many hashing jobs as it will queue, or could
+    not run a job as its processes died or it was shut down
+    """
+
+def _ignore_interrupts() -> None:
+    """
+    Leaves ctrl c to the server, run as each worker process starts, as the server shuts
+    the pool down itself with HashPool.shutdown()
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _checkpw(password: bytes, hashed: bytes) -> tuple[bool, float]:
+    """
+    Checks a password against its hash, run in a worker process
+
+    Returns:
+        whether the password matches, and the seconds spent hashing
+    """
+    start = time.perf_counter()
+    return bcrypt.checkpw(password, hashed), time.perf_counter() - start
+
+def _hashpw(password: bytes) -> tuple[bytes, float]:
+    """
+    Hashes a new password, run in a worker process
+
+    Returns:
+        the hashed password, and the seconds spent hashing
+    """
+    start = time.perf_counter()
+    return bcrypt.hashpw(password, bcrypt.gensalt()), time.perf_counter() - start
+
+class HashPool:
+    """
+    Runs bcrypt on a dedicated pool of processes, so hashing neither holds the GIL nor
+    takes every core from in game traffic
+    Jobs past the pool's queue size are refused straight away rather than piling up
+    A pool broken by a process dying is replaced, so hashing recovers by itself
+
+    Args:
+        workers (int): number of hashing processes
+        max_queue (int): number of jobs that may wait for a free process
+    """
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.executor = self.start()
+        self.lock = threading.Lock()
+        self.outstanding = 0 # jobs running or queued
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0 # jobs lost to the pool breaking or shutting down
+        self.latency_total = 0.0 # seconds from submitting to result, including queueing
+        self.latency_max = 0.0
+        self.hash_total = 0.0 # seconds spent hashing in the workers
+
+    def start(self) -> ProcessPoolExecutor:
+        """
+        Starts the worker processes
+
+        Returns:
+            the executor running them
+        """
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_ignore_interrupts
+        )
+
+    def replace(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Starts new worker processes in place of a broken pool, unless another job
+        already has
+
+        Args:
+            broken (ProcessPoolExecutor): the executor that broke
+        """
+        with self.lock:
+            if self.executor is broken:
+                self.executor = self.start()
+        broken.shutdown(wait=False)
+
+    def run(self, func, *args):
+        """
+        Runs func in a worker process, blocking the calling thread until it is done
+
+        Returns:
+            the result of func
+
+        Raises:
+            PoolBusy: if the pool's queue is full, or the job was lost to the pool
+                      breaking or shutting down
+        """
+        with self.lock:
+            if self.outstanding >= self.capacity:
+                self.rejected += 1
+                raise PoolBusy
+            self.outstanding += 1
+            executor = self.executor
+
+        start = time.perf_counter()
+        hash_time = 0.0
+        failed = False
+        try:
+            result, hash_time = executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            self.replace(executor)
+            failed = True
+        # the pool was shut down, as the server is stopping
+        except (RuntimeError, CancelledError):
+            failed = True
+        finally:
+            latency = time.perf_counter() - start
+            with self.lock:
+                self.outstanding -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    self.hash_total += hash_time
+        if failed:
+            raise PoolBusy
+        return result
+
+    def checkpw(self, password: str, hashed: str) -> bool:
+        """
+        Checks a password against its stored hash
+
+        Returns:
+            True if the password matches, else false
+        """
+        return self.run(_checkpw, password.encode(), hashed.encode())
+
+    def hashpw(self, password: str) -> str:
+        """
+        Hashes a password to be stored
+
+        Returns:
+            the hashed password
+        """
+        return self.run(_hashpw, password.encode()).decode()
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker processes once the jobs they are running finish, dropping any
+        still queued, called when the server stops
+        """
+        self.executor.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict:
+        """
+        Reports how busy the pool is and how long hashing takes, for sizing the pool
+
+        Returns:
+            dictionary of queue depth, job counts and mean/max latencies in milliseconds
+        """
+        with self.lock:
+            completed = self.completed or 1
+            return {
+                "queue_depth": max(0, self.outstanding - self.workers),
+                "in_flight": min(self.outstanding, self.workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "mean_latency_ms": round(self.latency_total / completed * 1000, 2),
+                "max_latency_ms": round(self.latency_max * 1000, 2),
+                "mean_hash_ms": round(self.hash_total / completed * 1000, 2)
+            }
@@ -0,0 +1,303 @@
+# imports
+import os
+import sys
+import mmap
+import zlib
+import time
+import queue
+import struct
+import argparse
+import threading
+from array import array
+from datetime import datetime
+from typing import Iterator, Optional
+import game
+import protocol
+
+# constants and globals
+# started, ended, board size, win length, status code, winner's seat, number of moves
+HEADER = struct.Struct("<ddBBBBH")
+# ended, offset of the record in the log, hashes of both players' names
+INDEX_ENTRY = struct.Struct("<dQII")
+NO_WINNER = 255
+STATUS_NAMES = {0: "win", 1: "draw", 2: "forfeit"}
+records = queue.SimpleQueue() # encoded records waiting for the writer, None to stop it
+writer = None # thread appending records to the log
+
+"""
+Every finished game is appended to a log as a record holding its players, moves, result
+and times, each record prefixed by its length as in the framed protocol. Records are
+queued by the game's thread and written in batches by a thread of its own, with one
+fsync per batch, so a game never waits on the disk
+An index file beside the log holds a fixed size entry for each record, so a player's
+games or the games of a time range can be found without reading the whole log
+
+All of the following functions use one or more of these args
+
+Args:
+    path (str): path of the log, its index is the same path ending in .idx
+    name (str): a player's username
+"""
+def name_hash(name: str) -> int:
+    """
+    Returns:
+        the hash a player's name is indexed by
+    """
+    return zlib.crc32(name.encode())
+
+def encode_record(room_name: str, players: list[str], moves: list[int], status: int,
+                  winner: int, size: int, win_length: int, started: float,
+                  ended: float) -> bytes:
+    """
+    Encodes a finished game as a record of the log
+
+    Args:
+        moves (list[int]): cell of each move in order, size * row + col
+        status (int): the game's gameend status code
+        winner (int): index of the winner in players, NO_WINNER for a draw
+
+    Returns:
+        the record, prefixed by its length
+    """
+    payload = HEADER.pack(started, ended, size, win_length, status, winner, len(moves)) + \
+array('H', moves).tobytes() + ':'.join([room_name] + players).encode()
+    return protocol.encode_length(len(payload)) + payload
+
+def decode_record(data, start: int = 0) -> tuple[Optional[dict], int]:
+    """
+    Decodes the record starting at start
+
+    Args:
+        data: the log's contents, or a part of it
+
+    Returns:
+        (the game, index after the record), or (None, start) if the record is incomplete
+    """
+    length, prefix_size = protocol.decode_length(data, start)
+    end = start + prefix_size + length
+    if length < 0 or end > len(data):
+        return None, start
+
+    offset = start + prefix_size
+    started, ended, size, win_length, status, winner, n_moves = \
+HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+    moves = array('H', data[offset:offset + 2 * n_moves]).tolist()
+    names = bytes(data[offset + 2 * n_moves:end]).decode().split(':')
+    return {
+        "room": names[0],
+        "players": names[1:],
+        "moves": moves,
+        "status": status,
+        "winner": names[1 + winner] if winner != NO_WINNER else "",
+        "size": size,
+        "win_length": win_length,
+        "started": started,
+        "ended": ended
+    }, end
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+def recover(path: str) -> int:
+    """
+    Cuts off any record or index entry left half written by a crash, and any record
+    written without its index entry
+
+    Returns:
+        size of the log once recovered
+    """
+    with open(path, 'ab+') as log, open(index_path(path), 'ab+') as index:
+        index_size = index.seek(0, os.SEEK_END)
+        index_size -= index_size % INDEX_ENTRY.size
+        index.truncate(index_size)
+
+        log_size = 0
+        if index_size:
+            index.seek(index_size - INDEX_ENTRY.size)
+            _, offset, _, _ = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+            log.seek(offset)
+            length, prefix_size = protocol.decode_length(log.read(4))
+            log_size = offset + prefix_size + length
+        log.truncate(log_size)
+        return log_size
+
+def write_records(path: str) -> None:
+    """
+    Appends queued records to the log until stopped, taking everything queued at once
+    so the records queued during one fsync share the next
+    """
+    offset = recover(path)
+    with open(path, 'ab') as log, open(index_path(path), 'ab') as index:
+        stopping = False
+        while not stopping:
+            batch = [records.get()]
+            while not records.empty():
+                batch.append(records.get())
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record]
+
+            entries = bytearray()
+            for record, ended, players in batch:
+                entries += INDEX_ENTRY.pack(ended, offset, *map(name_hash, players))
+                offset += len(record)
+            log.write(b''.join(record for record, _, _ in batch))
+            log.flush()
+            os.fsync(log.fileno())
+            index.write(entries)
+            index.flush()
+            os.fsync(index.fileno())
+
+def start(path: str) -> None:
+    """
+    Starts the writer, appending to the log at path
+    """
+    global writer
+    writer = threading.Thread(target=write_records, args=(path,), daemon=True)
+    writer.start()
+
+def record(room_name: str, players: list[str], moves: list[int], status: int,
+           winner: int, size: int, win_length: int, started: float) -> None:
+    """
+    Queues a finished game to be written, does nothing if the writer is not started
+    """
+    if not writer:
+        return
+    ended = time.time()
+    data = encode_record(room_name, players, moves, status, winner, size, win_length,
+                         started, ended)
+    records.put((data, ended, players))
+
+def stop() -> None:
+    """
+    Writes every queued record then stops the writer
+    """
+    global writer
+    if writer:
+        records.put(None)
+        writer.join()
+        writer = None
+
+def scan(path: str) -> Iterator[dict]:
+    """
+    Reads every game in the log, in the order they finished
+    """
+    with open(path, 'rb') as log:
+        if not os.fstat(log.fileno()).st_size:
+            return
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while True:
+                game_record, start = decode_record(data, start)
+                if not game_record:
+                    return
+                yield game_record
+
+def find(path: str, name: str = "", since: float = 0.0,
+         until: float = float("inf")) -> Iterator[dict]:
+    """
+    Reads the games of a player, or of every player if no name is given, that finished
+    in a time range, using the index to read only those records
+
+    Args:
+        since (float): earliest time a game finished, in seconds since the epoch
+        until (float): latest time a game finished
+    """
+    with open(index_path(path), 'rb') as index_file:
+        index = index_file.read()
+    with open(path, 'rb') as log:
+        if not index or not os.fstat(log.fileno()).st_size:
+            return
+        wanted = name_hash(name) if name else None
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for ended, offset, hash1, hash2 in INDEX_ENTRY.iter_unpack(index):
+                if not since <= ended <= until:
+                    continue
+                if wanted is not None and wanted != hash1 and wanted != hash2:
+                    continue
+                game_record, _ = decode_record(data, offset)
+                # names sharing a hash are told apart by the record itself
+                if game_record and (not name or name in game_record["players"]):
+                    yield game_record
+
+def replay(game_record: dict) -> list[str]:
+    """
+    Plays a recorded game's moves again
+
+    Returns:
+        the board after each move, as in boardstatus messages
+    """
+    bitboards = game.create_bitboards()
+    boards = []
+    for turn, cell in enumerate(game_record["moves"]):
+        col, row = cell % game_record["size"], cell // game_record["size"]
+        game.place(bitboards, turn % 2, col, row, game_record["size"])
+        boards.append(game.board_status(bitboards, game_record["size"]))
+    return boards
+
+def describe(game_record: dict) -> str:
+    """
+    Returns:
+        a line describing the game
+    """
+    ended = datetime.fromtimestamp(game_record["ended"]).isoformat(' ', 'seconds')
+    result = STATUS_NAMES.get(game_record["status"], str(game_record["status"]))
+    if game_record["winner"]:
+        result += " for " + game_record["winner"]
+    return f"{ended} {game_record['room']}: {' vs '.join(game_record['players'])}, " \
+f"{result} after {len(game_record['moves'])} moves"
+
+def read_time(text: str) -> float:
+    """
+    Returns:
+        a time given in seconds since the epoch or as an ISO date, in seconds
+    """
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def main(args: list[str]) -> None:
+    """
+    Lists, replays or counts the games in history logs
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    parser = argparse.ArgumentParser(description="Lists, replays or counts recorded games")
+    parser.add_argument("logs", nargs='+', help="history logs, one per worker")
+    parser.add_argument("--player", default="", help="only games this player played")
+    parser.add_argument("--since", type=read_time, default=0.0,
+                        help="only games finished at or after this time")
+    parser.add_argument("--until", type=read_time, default=float("inf"),
+                        help="only games finished at or before this time")
+    parser.add_argument("--replay", action="store_true", help="show each game's boards")
+    parser.add_argument("--count", action="store_true",
+                        help="only count the games and their results")
+    args = parser.parse_args(args)
+
+    counts = {}
+    start_time = time.perf_counter()
+    for path in args.logs:
+        if args.player or args.since or args.until != float("inf"):
+            games = find(path, args.player, args.since, args.until)
+        else:
+            games = scan(path)
+        for game_record in games:
+            result = STATUS_NAMES.get(game_record["status"], str(game_record["status"]))
+            counts[result] = counts.get(result, 0) + 1
+            if args.count:
+                continue
+            print(describe(game_record))
+            if args.replay:
+                for board in replay(game_record):
+                    print("    " + board)
+
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - start_time
+    print(f"{total} games ({', '.join(f'{n} {result}' for result, n in counts.items())}) "
+          f"read in {elapsed:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
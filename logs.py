@@ -0,0 +1,93 @@
+# imports
+import sys
+import queue
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+
+# constants and globals
+ROOT = "tictactoe" # every category's logger is a child of this one
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+"""
+Server output goes through a logger for each category (e.g. connections, commands), so
+each can be given its own sampling rate. Records are only queued by the thread logging
+them, then formatted and written by a thread of its own, so a slow console never holds
+up a client
+
+All of the following functions use one or more of these args
+
+Args:
+    category (str): what a record is about (e.g. connections, commands)
+"""
+class SampleFilter(logging.Filter):
+    """
+    Keeps only one in every n records of a category, below warning level, so busy
+    categories can be logged without writing every record
+    """
+    def __init__(self, rates: dict) -> None:
+        """
+        Args:
+            rates (dict): key - category : value - n, categories not given keep every record
+        """
+        super().__init__()
+        self.rates = rates
+        self.counts = {} # key - logger name : value - count of its records seen
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name.removeprefix(ROOT + '.'), 1)
+        if rate <= 1 or record.levelno >= logging.WARNING:
+            return True
+        seen = self.counts.get(record.name)
+        if not seen:
+            seen = self.counts.setdefault(record.name, itertools.count())
+        return next(seen) % rate == 0
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queues records for the listener without formatting them first, as they never leave
+    the process, leaving all formatting to the listener's thread
+    Closing the handler writes everything still queued
+    """
+    def __init__(self, records: queue.SimpleQueue) -> None:
+        super().__init__(records)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter(FORMAT))
+        self.listener = QueueListener(records, output)
+        self.listener.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def close(self) -> None:
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+def get(category: str) -> logging.Logger:
+    """
+    Returns:
+        the category's logger
+    """
+    return logging.getLogger(ROOT + '.' + category)
+
+def setup(config: dict) -> None:
+    """
+    Sends every category's records to stdout through the background writer
+    The level is set by the config's logLevel (default INFO), and the sampling rate of
+    each category by logSampling (e.g. {"commands": 100} keeps one in every 100 commands)
+    Must be called in each worker, after any forking, as it starts the writer's thread
+
+    Args:
+        config (dict): the loaded server config
+    """
+    root = logging.getLogger(ROOT)
+    for handler in root.handlers:
+        handler.close()
+
+    handler = RecordQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SampleFilter(config.get("logSampling", {})))
+    root.handlers = [handler]
+    root.setLevel(config.get("logLevel", "INFO"))
+    root.propagate = False
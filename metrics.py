@@ -0,0 +1,175 @@
+# imports
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# constants and globals
+# upper bounds in seconds of each latency histogram bucket, the last catches the rest
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+lock = threading.Lock()
+histograms = {} # key - (family, command) : value - Histogram
+counters = {} # key - counter name : value - count
+gauges = {} # key - gauge name : value - function returning its current value
+
+class Histogram:
+    """
+    Counts how many observed latencies fell into each of BUCKETS, so percentiles can be
+    estimated without keeping every observation
+    """
+    def __init__(self) -> None:
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """
+        Adds a latency to its bucket, called holding the lock
+        """
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a percentile, interpolating within the bucket it falls in
+
+        Args:
+            q (float): the percentile as a fraction (e.g. 0.99)
+
+        Returns:
+            the estimated latency in seconds, 0 if nothing was observed
+        """
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            if bucket and seen + bucket >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket
+            seen += bucket
+        return 0.0
+
+"""
+All of the following functions use one or more of these args
+
+Args:
+    family (str): what is being timed, "command" for lobby commands or "move" for in
+                  room commands
+    command (str): the command's keyword (e.g. LOGIN, PLACE)
+    name (str): the name of a counter or gauge
+"""
+def observe(family: str, command: str, seconds: float) -> None:
+    """
+    Records how long handling a command took
+    """
+    with lock:
+        histogram = histograms.get((family, command))
+        if not histogram:
+            histogram = histograms[(family, command)] = Histogram()
+        histogram.observe(seconds)
+
+def count(name: str, amount: int = 1) -> None:
+    """
+    Adds to a counter
+    """
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def gauge(name: str, func) -> None:
+    """
+    Registers a gauge, read each time metrics are reported
+
+    Args:
+        func: function returning the gauge's current value
+    """
+    gauges[name] = func
+
+def read_gauges() -> dict:
+    """
+    Returns:
+        dictionary of each gauge's current value
+    """
+    return {name: func() for name, func in gauges.items()}
+
+def summary() -> dict:
+    """
+    Summarises every metric, with latencies as counts and percentiles in milliseconds
+
+    Returns:
+        dictionary of metric name to value
+    """
+    stats = read_gauges()
+    with lock:
+        stats.update(counters)
+        for (family, command), histogram in sorted(histograms.items()):
+            key = f"{family}.{command}"
+            stats[key + ".count"] = histogram.count
+            for q in (0.5, 0.99):
+                stats[f"{key}.p{round(q * 100)}_ms"] = round(histogram.quantile(q) * 1000, 3)
+    return stats
+
+def prometheus() -> str:
+    """
+    Renders every metric in the Prometheus text format
+
+    Returns:
+        the metrics page
+    """
+    lines = []
+    for name, value in read_gauges().items():
+        lines += [f"# TYPE tictactoe_{name} gauge", f"tictactoe_{name} {value}"]
+
+    with lock:
+        for name, value in counters.items():
+            metric = f"tictactoe_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+        for family in sorted({family for family, command in histograms}):
+            metric = f"tictactoe_{family}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (hist_family, command), histogram in sorted(histograms.items()):
+                if hist_family != family:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, histogram.buckets):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else bound
+                    labels = f'command="{command}",le="{le}"'
+                    lines.append(f'{metric}_bucket{{{labels}}} {cumulative}')
+                lines.append(f'{metric}_sum{{command="{command}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{command="{command}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Prometheus metrics page at /metrics
+    """
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """
+        Keeps scrapes out of the server's output
+        """
+
+def serve(port: int) -> None:
+    """
+    Serves the metrics page on localhost in a thread of its own
+
+    Args:
+        port (int): the port to serve on
+    """
+    http_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
@@ -0,0 +1,424 @@
+# imports
+import abc
+import math
+import time
+import socket
+import threading
+from collections import deque
+from typing import Optional
+
+# constants and globals
+MAX_MSG_SZ = 8192 # longest message a client may send, and the most read at once
+MAX_PREFIX_SZ = 4 # bytes in the longest length prefix
+CLOSE_TIMEOUT = 5 # seconds a closing connection may take to write what it has queued
+LEGACY_VERSION = 1 # each recv() is one text message
+FRAMED_VERSION = 2 # text messages, each prefixed by its length
+BINARY_VERSION = 3 # as FRAMED_VERSION, with binary place, boardstatus and gameend
+SUPPORTED_VERSIONS = (LEGACY_VERSION, FRAMED_VERSION, BINARY_VERSION)
+
+# first byte of a binary message, text messages always start with a letter
+PLACE_OP = 1 # col, row
+BOARDSTATUS_OP = 2 # board size, packed board
+GAMEEND_OP = 3 # status code, board size, packed board, winner
+MOVE_OP = 4 # sequence number, cell, each as a length prefix
+SNAPSHOT_OP = 5 # sequence number as a length prefix, seat to move, board size, packed board
+BINARY_OPS = {"BOARDSTATUS": BOARDSTATUS_OP, "GAMEEND": GAMEEND_OP, "PLACE": PLACE_OP,
+              "MOVE": MOVE_OP, "SNAPSHOT": SNAPSHOT_OP}
+
+class ProtocolError(OSError):
+    """
+    Raised when a connection receives data that is not a valid message, an OSError so
+    it is handled as the connection closing
+    """
+
+"""
+All of the following functions use one or more of these args
+
+Args:
+    msg (str): A text message (e.g. BOARDSTATUS:100020000)
+    payload (bytes): The body of a frame, either a text or binary message
+    board (str): holds 0s, 1s or 2s for blank spot X and O respectively for each space
+                 on the board from left to right, top to bottom
+"""
+def pack_board(board: str) -> bytes:
+    """
+    Packs a board into 2 bits per cell, 4 cells per byte
+
+    Returns:
+        packed board
+    """
+    packed = bytearray((len(board) + 3) // 4)
+    for index, cell in enumerate(board):
+        packed[index // 4] |= int(cell) << (index % 4 * 2)
+    return bytes(packed)
+
+def unpack_board(packed: bytes, size: int) -> str:
+    """
+    Unpacks a board packed by pack_board()
+
+    Args:
+        size (int): the number of rows and columns on the board
+
+    Returns:
+        board
+    """
+    return ''.join(
+        str(packed[index // 4] >> (index % 4 * 2) & 3) for index in range(size * size)
+    )
+
+def encode_binary(msg: str) -> bytes:
+    """
+    Encodes a place, boardstatus, gameend, move or snapshot message in its binary form
+
+    Returns:
+        binary message, or the text message encoded if it has no binary form
+    """
+    parts = msg.split(':')
+    if parts[0] == "PLACE" and len(parts) == 3:
+        return bytes((PLACE_OP, int(parts[1]), int(parts[2])))
+    if parts[0] == "BOARDSTATUS":
+        return bytes((BOARDSTATUS_OP, math.isqrt(len(parts[1])))) + pack_board(parts[1])
+    if parts[0] == "GAMEEND":
+        winner = parts[3] if len(parts) > 3 else ""
+        return bytes((GAMEEND_OP, int(parts[2]), math.isqrt(len(parts[1])))) + \
+pack_board(parts[1]) + winner.encode()
+    if parts[0] == "MOVE":
+        return bytes((MOVE_OP,)) + encode_length(int(parts[1])) + encode_length(int(parts[2]))
+    if parts[0] == "SNAPSHOT":
+        return bytes((SNAPSHOT_OP,)) + encode_length(int(parts[1])) + \
+bytes((int(parts[2]), math.isqrt(len(parts[3])))) + pack_board(parts[3])
+    return msg.encode()
+
+def decode_text(data: bytes) -> list[str]:
+    """
+    Decodes a text message
+
+    Args:
+        data (bytes): the message, encoded as UTF-8
+
+    Returns:
+        the message split into its arguments
+
+    Raises:
+        ProtocolError: if the message is not UTF-8
+    """
+    try:
+        return data.decode().strip().split(':')
+    except UnicodeDecodeError as e:
+        raise ProtocolError(f"Message is not UTF-8: {e}") from e
+
+def decode_payload(payload: bytes) -> list[str]:
+    """
+    Decodes a text or binary message
+
+    Returns:
+        the message split into its arguments, as a text message would be
+
+    Raises:
+        ProtocolError: if the message is cut short or is not UTF-8
+    """
+    if not payload or payload[0] >= 32:
+        return decode_text(payload)
+
+    try:
+        if payload[0] == PLACE_OP:
+            if len(payload) != 3:
+                raise ProtocolError(f"Place message is {len(payload)} bytes, not 3")
+            return ["PLACE", str(payload[1]), str(payload[2])]
+        if payload[0] == BOARDSTATUS_OP:
+            return ["BOARDSTATUS", unpack_board(payload[2:], payload[1])]
+        if payload[0] == GAMEEND_OP:
+            size = payload[2]
+            board_end = 3 + (size * size + 3) // 4
+            msg = ["GAMEEND", unpack_board(payload[3:board_end], size), str(payload[1])]
+            if payload[board_end:]:
+                msg.append(payload[board_end:].decode())
+            return msg
+        if payload[0] == MOVE_OP:
+            seq, seq_size = decode_length(payload, 1)
+            cell, cell_size = decode_length(payload, 1 + seq_size)
+            if not seq_size or not cell_size:
+                raise ProtocolError("Move message is cut short")
+            return ["MOVE", str(seq), str(cell)]
+        if payload[0] == SNAPSHOT_OP:
+            seq, seq_size = decode_length(payload, 1)
+            if not seq_size:
+                raise ProtocolError("Snapshot message is cut short")
+            seat, size = payload[1 + seq_size], payload[2 + seq_size]
+            return ["SNAPSHOT", str(seq), str(seat), unpack_board(payload[3 + seq_size:], size)]
+    # boards shorter than their size, or missing fields
+    except IndexError as e:
+        raise ProtocolError(f"Binary message {payload[0]} is cut short") from e
+    except UnicodeDecodeError as e:
+        raise ProtocolError(f"Message is not UTF-8: {e}") from e
+    return ["UNKNOWN"]
+
+def encode_length(length: int) -> bytes:
+    """
+    Encodes a frame's length prefix, 7 bits per byte with the high bit set on every
+    byte but the last, so short messages need a single byte
+
+    Returns:
+        length prefix
+    """
+    prefix = bytearray()
+    while length >= 0x80:
+        prefix.append(length & 0x7F | 0x80)
+        length >>= 7
+    prefix.append(length)
+    return bytes(prefix)
+
+def decode_length(buffer: bytearray, start: int = 0) -> tuple[int, int]:
+    """
+    Reads a frame's length prefix from the buffer
+
+    Args:
+        start (int): index of the prefix in the buffer
+
+    Returns:
+        (length, size of prefix), or (-1, 0) if the whole prefix has not arrived
+    """
+    length = 0
+    for index, byte in enumerate(buffer[start:start + MAX_PREFIX_SZ]):
+        length |= (byte & 0x7F) << (7 * index)
+        if byte < 0x80:
+            return length, index + 1
+    return -1, 0
+
+class Connection(abc.ABC):
+    """
+    Holds a connection's protocol version and unread data, turning text messages into
+    what is sent and received data into messages
+    Connections start on the legacy protocol, until upgraded by a HELLO message
+    Every complete message received is kept until read, so clients may send several
+    messages without waiting for each reply
+    Sent messages are queued for the connection's writer, so sending never waits on a
+    client that is slow to read
+    """
+    def __init__(self) -> None:
+        self.version = LEGACY_VERSION
+        self.buffer = bytearray() # received data, unread from index start
+        self.start = 0
+        self.outbox = deque() # (message type, data) waiting to be written
+        self.lock = threading.Lock()
+        self.closing = False
+        self.active = time.monotonic() # time data was last received, for idle timeouts
+        self.timers = {} # key - what the timer is for : value - the server's timer
+                         # watching the connection, cancelled once it closes
+        self.max_length = MAX_MSG_SZ # longest message accepted, 0 for no limit, so a
+                                     # client can not make the buffer grow without end
+
+    def sendall(self, data: bytes, limit: int = 0, coalesce: bool = False) -> bool:
+        """
+        Queues data to be written to the client, safe to call from any thread
+
+        Args:
+            data (bytes): one or more text messages, separated by newlines
+            limit (int): the most messages that may be waiting, 0 for no limit
+            coalesce (bool): whether to drop waiting boardstatus and move messages once
+                             the limit is reached, as each board replaces the last and
+                             a viewer missing moves asks for a snapshot
+
+        Returns:
+            True if queued, else false if the client is too far behind
+        """
+        msg_type = data.split(b':', 1)[0]
+        data = self.encode(data)
+        with self.lock:
+            if self.closing:
+                return True
+            if limit and len(self.outbox) >= limit:
+                if coalesce:
+                    self.outbox = deque(
+                        queued for queued in self.outbox
+                        if queued[0] != b"BOARDSTATUS" and queued[0] != b"MOVE"
+                    )
+                if len(self.outbox) >= limit:
+                    return False
+            self.outbox.append((msg_type, data))
+            self.wake()
+        return True
+
+    def unread(self) -> bytes:
+        """
+        Returns:
+            the data received but not yet read as messages
+        """
+        return bytes(self.buffer[self.start:])
+
+    def take_outbox(self) -> bytes:
+        """
+        Takes everything waiting to be written, called by the connection's writer
+
+        Returns:
+            the queued data joined, to be written at once, each message still ended by a
+            newline or framed
+        """
+        with self.lock:
+            batch = self.outbox
+            self.outbox = deque()
+        return b''.join(data for msg_type, data in batch)
+
+    @abc.abstractmethod
+    def wake(self) -> None:
+        """
+        Tells the connection's writer there is data waiting, called holding the lock
+        """
+
+    def feed(self, data: bytes) -> None:
+        """
+        Adds received data to the end of the unread data
+        Data already read is only dropped here, rather than after every message
+        """
+        self.active = time.monotonic()
+        if self.start:
+            del self.buffer[:self.start]
+            self.start = 0
+        self.buffer += data
+
+    def encode(self, data: bytes) -> bytes:
+        """
+        Frames outgoing data, splitting newline separated messages into their own frames
+        Legacy messages are ended with a newline instead, so messages queued together
+        can still be told apart
+
+        Args:
+            data (bytes): one or more text messages, separated by newlines
+
+        Returns:
+            data to send
+        """
+        if self.version == LEGACY_VERSION:
+            return data if data.endswith(b'\n') else data + b'\n'
+
+        framed = bytearray()
+        for msg in data.decode().split('\n'):
+            if not msg:
+                continue
+            payload = encode_binary(msg) if self.version >= BINARY_VERSION else msg.encode()
+            framed += encode_length(len(payload)) + payload
+        return bytes(framed)
+
+    def next_message(self) -> Optional[list[str]]:
+        """
+        Takes the next complete message out of the unread data
+        Legacy messages end at a newline, or at the end of the data received, as
+        clients without newlines send each message on its own
+
+        Returns:
+            the message split into its arguments, or None if a whole one has not arrived
+
+        Raises:
+            ProtocolError: if the message is not valid
+        """
+        if self.start == len(self.buffer):
+            return None
+
+        if self.version == LEGACY_VERSION:
+            end = self.buffer.find(b'\n', self.start)
+            if end < 0:
+                end = len(self.buffer)
+            data = bytes(self.buffer[self.start:end])
+            self.start = min(end + 1, len(self.buffer))
+            return decode_text(data)
+
+        length, prefix_size = decode_length(self.buffer, self.start)
+        if length < 0 and len(self.buffer) - self.start >= MAX_PREFIX_SZ:
+            raise ProtocolError(f"Length prefix is longer than {MAX_PREFIX_SZ} bytes")
+        if self.max_length and length > self.max_length:
+            raise ProtocolError(f"Message of {length} bytes is over {self.max_length}")
+        end = self.start + prefix_size + length
+        if length < 0 or len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[self.start + prefix_size:end])
+        self.start = end
+        return decode_payload(payload)
+
+class SocketConnection(Connection):
+    """
+    A connection over a blocking socket, used in place of the socket itself
+    Queued data is written by a thread of its own
+    """
+    def __init__(self, sock: socket.socket) -> None:
+        super().__init__()
+        self.socket = sock
+        self.recv_buffer = memoryview(bytearray(MAX_MSG_SZ)) # reused by every recv
+        self.ready = threading.Condition(self.lock)
+        self.detached = False
+        self.writer = threading.Thread(target=self.write_outbox, daemon=True)
+        self.writer.start()
+
+    def wake(self) -> None:
+        self.ready.notify()
+
+    def write_outbox(self) -> None:
+        """
+        Writes queued data until the connection is closed, then closes the socket
+        """
+        while True:
+            with self.ready:
+                self.ready.wait_for(lambda: self.outbox or self.closing)
+                if not self.outbox:
+                    break
+            try:
+                self.socket.sendall(self.take_outbox())
+            except OSError:
+                self.shutdown(socket.SHUT_RDWR)
+                break
+        if not self.detached:
+            self.socket.close()
+
+    def recv_msg(self) -> list[str]:
+        """
+        Blocks until a whole message has been received
+
+        Returns:
+            the message split into its arguments, [''] if the connection closed
+        """
+        msg = self.next_message()
+        while msg is None:
+            size = self.socket.recv_into(self.recv_buffer)
+            if not size:
+                return ['']
+            self.feed(self.recv_buffer[:size])
+            msg = self.next_message()
+        return msg
+
+    def shutdown(self, how: int) -> None:
+        """
+        Shuts down the socket, ending any pending recv_msg() or write, and marks the
+        connection as closing so a command held for it is let go
+        """
+        with self.ready:
+            self.closing = True
+            self.ready.notify()
+        try:
+            self.socket.shutdown(how)
+        except OSError:
+            pass
+
+    def detach(self) -> socket.socket:
+        """
+        Stops the writer once its queued data is written, leaving the socket open
+
+        Returns:
+            the socket, for another process to take over
+        """
+        with self.ready:
+            self.closing = True
+            self.detached = True
+            self.ready.notify()
+        self.writer.join(CLOSE_TIMEOUT)
+        return self.socket
+
+    def close(self) -> None:
+        """
+        Closes the socket once its queued data is written, giving up on a client that
+        has not read it within CLOSE_TIMEOUT
+        """
+        with self.ready:
+            self.closing = True
+            self.ready.notify()
+        self.writer.join(CLOSE_TIMEOUT)
+        if self.writer.is_alive():
+            self.shutdown(socket.SHUT_RDWR)
@@ -0,0 +1,83 @@
+# imports
+import bisect
+import threading
+import user_store
+
+# constants and globals
+WIN, LOSS, DRAW, FORFEIT = range(len(user_store.RESULTS)) # indexes into a user's counts
+MAX_LEADERBOARD = 100 # most players sent in one leaderboard
+store = None # the user_store.UserStore holding every user's counts
+ranking = [] # rank key of every user who has played, sorted best first
+lock = threading.Lock()
+version = 0 # changes whenever the ranking does
+
+"""
+Players are ranked by most wins, then fewest losses and forfeits, then name. The ranking
+is kept sorted as each result comes in, so the top players are a slice of it and any
+player's rank is a binary search
+
+All of the following functions use one or more of these args
+
+Args:
+    username (str): a player's name
+"""
+def rank_key(username: str, counts: list[int]) -> tuple[int, int, str]:
+    """
+    Args:
+        counts (list[int]): the player's number of each of user_store.RESULTS
+
+    Returns:
+        the player's place in the ranking's sort order
+    """
+    return -counts[WIN], counts[LOSS] + counts[FORFEIT], username
+
+def setup(users: user_store.UserStore) -> None:
+    """
+    Ranks every player with stored results
+
+    Args:
+        users (user_store.UserStore): the opened user store
+    """
+    global store, ranking
+    store = users
+    ranking = sorted(rank_key(username, counts) for username, counts in store.stats.items())
+
+def record(username: str, result: int) -> None:
+    """
+    Counts a game result for a player and moves them to their new place in the ranking
+
+    Args:
+        result (int): one of WIN, LOSS, DRAW or FORFEIT
+    """
+    global version
+    with lock:
+        counts = store.stats.get(username)
+        if counts:
+            index = bisect.bisect_left(ranking, rank_key(username, counts))
+            del ranking[index]
+        counts = store.count_result(username, result)
+        bisect.insort(ranking, rank_key(username, counts))
+        version += 1
+
+def top(count: int) -> list[tuple[str, list[int]]]:
+    """
+    Args:
+        count (int): how many players to get
+
+    Returns:
+        (username, counts) of the best count players, best first
+    """
+    with lock:
+        return [(key[2], store.stats[key[2]].copy()) for key in ranking[:count]]
+
+def lookup(username: str) -> tuple[list[int], int]:
+    """
+    Returns:
+        (the player's counts, their place in the ranking from 1), or (all 0s, 0) if
+        they have not played
+    """
+    with lock:
+        counts = store.stats.get(username)
+        if not counts:
+            return [0] * len(user_store.RESULTS), 0
+        return counts.copy(), bisect.bisect_left(ranking, rank_key(username, counts)) + 1
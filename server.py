@@ -1,26 +1,198 @@
 # imports
 import sys
 import os
+import gc
 import json
 import socket
 import threading
 import re
-import bcrypt
+import time
+import secrets
+import itertools
+import collections
+import bisect
 import game
+import ai
+import history
+import snapshot
+import rankings
+import user_store
+import hash_pool
+import protocol
+import cluster
+import metrics
+import logs
+import timers
 
 # constants and globals
-MAX_MSG_SZ = 8192
-user_database = "" # will update to databse of registered users
-online_users = {} # key - client_socket : values - username, room, type
-rooms = {} # key - room name : values - players, p_sockets, viewers, v_sockets, 
-           # game state, board_status, turn, game_begun
-escp_gm_msg = ""
+users = None # user_store.UserStore of registered users, opened on setup
+hasher = None # hash_pool.HashPool that runs bcrypt, started on setup
+session_grace = 0 # seconds a dropped client's session and seat are held for RESUME
+login_timeout = 0 # seconds a client has to log in before being dropped, 0 for no limit
+idle_timeout = 0 # seconds a client may sit out of a game without sending anything before
+                 # being dropped, 0 for no limit
+move_timeout = 0 # seconds a player has for each move before forfeiting, 0 for no limit
+snapshot_path = "" # file the rooms are saved to when the server stops, and restored from
+                   # when it starts, empty for none
+restore_grace = 0 # seconds the players of restored rooms have to return to their seats
+draining = False # whether the server is stopping, so dropped clients keep their seats
+held_players = {} # key - username : value - token of the session held for them in a
+                  # restored room, so logging in returns them to it
+max_rooms = 0 # most rooms that may exist at once
+MAX_ROOM_PAGE = 100 # most room names sent in one page of a room list
+ACCEPT_TIMEOUT = 1 # seconds the threaded engine waits for a client before waiting again,
+                   # as ctrl c may reach another thread, and is only handled once the
+                   # main thread wakes
+admins = [] # usernames allowed to see the server's metrics and debug output
+viewer_queue_limit = 0 # messages a viewer may fall behind by, 0 for no limit
+slow_viewer_policy = "coalesce" # viewers past the limit get just the latest board, or "disconnect"
+online_users = {} # key - client_socket : value - the user's Session
+sessions = {} # key - session token : value - Session, kept while its connection is dropped
+rooms = {} # key - room name : value - Room
+lobby = {"PLAYER": {}, "VIEWER": {}} # key - mode : value - names of rooms joinable in that
+                                     # mode, a dict so they stay in creation order
+lobby_sorted = {"PLAYER": [], "VIEWER": []} # key - mode : value - the same names sorted, for
+                                            # paging and prefix searches
+lobby_lock = threading.Lock() # held while the lobby changes or is read, as threads of the
+                              # threaded engine, and room lists in the asyncio engine's
+                              # cluster mode, use it at once
+lobby_versions = itertools.count(1)
+lobby_version = 0 # changes whenever the lobby does
+roomlist_cache = {} # key - mode : value - (lobby_version, encoded ROOMLIST acknowledgement)
+leaderboard_cache = {} # key - number of players : value - (rankings.version, encoded
+                       # LEADERBOARD acknowledgement)
+quickplay_rooms = {} # key - names of this worker's quickplay rooms waiting for their
+                     # second player : value - None
+quickplay_queue = collections.OrderedDict() # key - names of quickplay rooms waiting in any
+                                            # worker, oldest first, only kept by the first
+                                            # worker : value - None
+quickplay_ids = itertools.count(1)
+connection_log = logs.get("connections")
+command_log = logs.get("commands")
+room_log = logs.get("rooms")
+viewer_log = logs.get("viewers")
+cluster_log = logs.get("cluster")
+hash_log = logs.get("hashing")
+
+class RoomSignal:
+    """
+    Wakes the threads waiting on a change to a room's state, so waiting costs no CPU
+    Held with "with room.signal:" by the thread changing the room, so a move, a move
+    clock running out and a player leaving can not end the same game at once
+    """
+    __slots__ = ("condition",)
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition(threading.RLock())
+
+    def __enter__(self) -> None:
+        self.condition.acquire()
+
+    def __exit__(self, *exc_info) -> None:
+        self.condition.release()
+
+    def notify(self) -> None:
+        """
+        Wakes all waiting threads to recheck their condition
+        """
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait_for(self, predicate) -> None:
+        """
+        Blocks until predicate() is true, rechecking each time the room changes
+        """
+        with self.condition:
+            self.condition.wait_for(predicate)
+
+room_signal = RoomSignal # creates each room's signal, replaced by the asyncio engine
+
+class Room:
+    """
+    A room's players, viewers and game
+    Viewers are kept in a dict by socket, so they join and leave in O(1) while staying
+    in the order they joined
+    Rooms hold only what they need, as a server may hold 100000 of them, see
+    testing/memcheck.py
+    """
+    __slots__ = ("players", "p_sockets", "viewers", "streams", "game_state", "size",
+                 "win_length", "turn", "game_begun", "ai", "signal", "moves", "started")
+
+    def __init__(self, username: str, client_socket: socket.socket,
+                 size: int = game.BOARD_SIZE, win_length: int = game.BOARD_SIZE,
+                 against_ai: bool = False) -> None:
+        """
+        Creates a room with the client in the first seat
+
+        Args:
+            username (str): name of the client creating the room
+            size (int): the number of rows and columns on the board
+            win_length (int): the number in a row needed to win
+            against_ai (bool): whether the AI takes the second seat
+        """
+        self.players = [username]
+        self.p_sockets = [client_socket]
+        self.viewers = {} # key - viewer socket : value - username
+        self.streams = {} # key - sockets of viewers sent snapshots and moves rather than
+                          # boards : value - None, a dict as it is smaller than a set
+        self.game_state = game.create_bitboards()
+        self.size = size
+        self.win_length = win_length
+        self.turn = 0
+        self.game_begun = False
+        self.ai = against_ai
+        self.signal = room_signal()
+        self.moves = [] # cell of each move, size * row + col
+        self.started = 0.0 # time the game began
+
+class Session:
+    """
+    A logged in user, found by their connection in online_users and by their token in
+    sessions, so a dropped connection can be resumed
+    """
+    __slots__ = ("username", "room", "type", "token", "socket", "old_socket", "expires")
+
+    def __init__(self, username: str, token: str, client_socket: socket.socket) -> None:
+        self.username = username
+        self.room = "" # name of the room the user is in, empty in the lobby
+        self.type = "" # P1, P2 or VIEWER while in a room
+        self.token = token
+        self.socket = client_socket # None while the connection is dropped
+        self.old_socket = None # the dropped connection, still seated in the room
+        self.expires = 0.0 # time a dropped session ends
+
+    def export(self) -> dict:
+        """
+        Returns:
+            the user's state, for another worker to restore
+        """
+        return {"username": self.username, "room": self.room, "type": self.type,
+                "token": self.token}
+
+class RestoredSeat:
+    """
+    Stands in for the connection of a player in a restored room until they return,
+    discarding what the room sends it
+    """
+    __slots__ = ()
+
+    def sendall(self, data: bytes, limit: int = 0, coalesce: bool = False) -> bool:
+        return True
+
+    def shutdown(self, how: int) -> None:
+        pass
+
+def call_later(delay: float, func) -> timers.Timer:
+    """
+    Runs func after delay seconds, in the server's timer wheel
+    """
+    return timers.call_later(delay, func)
 
 """
 All of the following functions use one or more of these args
 
 Args:
-    client_socket (socket.socket): The socket object for connecting to the server
+    client_socket (socket.socket): The client's protocol.Connection, used like a socket
     msg_type (str): The keyword for that message type (e.g. LOGIN, PLACE)
 """
 def exit_server(client_socket: socket.socket, msg_recv: str) -> None:
@@ -29,6 +201,27 @@ def exit_server(client_socket: socket.socket, msg_recv: str) -> None:
     """
     raise OSError
 
+def hello(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients hello message, switching the connection to the requested protocol
+    version if supported, then sends acknowledgement of action, or why it was not possible
+    The acknowledgement is sent in the protocol the hello message was sent in
+    """
+    msg = msg_recv[0] + ":ACKSTATUS:"
+
+    # incorrect arguments
+    if len(msg_recv) != 2:
+        status_info = '2'
+    # unsupported version
+    elif not msg_recv[1].isdecimal() or int(msg_recv[1]) not in protocol.SUPPORTED_VERSIONS:
+        status_info = '1'
+    else:
+        status_info = '0'
+
+    client_socket.sendall((msg + status_info).encode())
+    if status_info == '0':
+        client_socket.version = int(msg_recv[1])
+
 def noroom_check(client_socket: socket.socket) -> bool:
     """
     Checks if client is not in a room
@@ -36,7 +229,7 @@ def noroom_check(client_socket: socket.socket) -> bool:
     Returns:
         True if not in a room, else false
     """
-    if online_users[client_socket]["room"] == "":
+    if online_users[client_socket].room == "":
         client_socket.sendall("NOROOM".encode())
         return True
     return False
@@ -51,13 +244,6 @@ def read_json(filename: str) -> dict:
     with open(filename, 'r') as f:
         return json.load(f)
 
-def write_json(filename: str, dictionary: dict) -> None:
-    """
-    Writes over the requested json file, using given dictoinary
-    """
-    with open(filename, 'w') as f:
-        json.dump(dictionary, f, indent=4)
-
 def find_user(username: str) -> str:
     """
     Looks for username in database
@@ -65,11 +251,7 @@ def find_user(username: str) -> str:
     Returns:
         password if found, else empty string
     """
-    user_data = read_json(user_database)
-    for user in user_data:
-        if user["username"] == username:
-            return user["password"]
-    return ""
+    return users.find(username)
 
 def login(client_socket: socket.socket, msg_recv: str) -> None:
     """
@@ -78,20 +260,31 @@ def login(client_socket: socket.socket, msg_recv: str) -> None:
     """
     msg = msg_recv[0] + ":ACKSTATUS:"
 
-    password = find_user(msg_recv[1])
+    password = find_user(msg_recv[1]) if len(msg_recv) > 1 else ""
     # incorrect arguments
     if len(msg_recv) != 3:
         status_info = '3'
     # user found
     elif password:
-        # correct password
-        if bcrypt.checkpw(msg_recv[2].encode(), password.encode()):
-            online_users[client_socket] = {
-                "username": msg_recv[1],
-                "room": "",
-                "type": ""
-            }
-            status_info = '0'
+        try:
+            password_correct = hasher.checkpw(msg_recv[2], password)
+        except hash_pool.PoolBusy:
+            password_correct = None
+
+        # too many logins being checked, or hashing failed, client should retry later
+        if password_correct is None:
+            status_info = '4'
+        # correct password, a player of a restored room takes back their seat
+        elif password_correct:
+            token = held_players.pop(msg_recv[1], "")
+            session = sessions.get(token)
+            if session and not session.socket:
+                reattach(client_socket, session)
+            else:
+                token = secrets.token_hex(16)
+                sessions[token] = Session(msg_recv[1], token, client_socket)
+                attach_session(client_socket, sessions[token])
+            status_info = '0:' + token + game_msg(client_socket)
         # incorrect password
         else:
             status_info = '2'
@@ -116,17 +309,205 @@ def register(client_socket: socket.socket, msg_recv: str) -> None:
         status_info = '1'
     # add to database
     else:
-        user_data = read_json(user_database)
+        try:
+            hashed_pw = hasher.hashpw(msg_recv[2])
+        except hash_pool.PoolBusy:
+            hashed_pw = ""
+
+        # too many passwords being hashed, or hashing failed, client should retry later
+        if not hashed_pw:
+            status_info = '3'
+        # another client may have taken the username while hashing
+        elif users.add(msg_recv[1], hashed_pw):
+            status_info = '0'
+        else:
+            status_info = '1'
 
-        hashed_pw = bcrypt.hashpw(msg_recv[2].encode(), bcrypt.gensalt())
-        new_user = {
-            "username": msg_recv[1],
-            "password": hashed_pw.decode()
-        }
+    client_socket.sendall((msg + status_info).encode())
 
-        user_data.append(new_user)
-        write_json(user_database, user_data)
-        status_info = '0'
+def resume(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients resume message, reattaching the session of an earlier connection
+    (and their seat, if they were in a room) to this one, then sends acknowledgement of
+    action, or why it was not possible
+    """
+    msg = msg_recv[0] + ":ACKSTATUS:"
+    session = sessions.get(msg_recv[1]) if len(msg_recv) == 2 else None
+
+    # incorrect arguments
+    if len(msg_recv) != 2:
+        status_info = '2'
+    # unknown or expired session
+    elif not session or session.socket is client_socket:
+        status_info = '1'
+    else:
+        reattach(client_socket, session)
+        status_info = '0' + game_msg(client_socket)
+
+    client_socket.sendall((msg + status_info).encode())
+
+def reattach(client_socket: socket.socket, session: Session) -> None:
+    """
+    Moves a session, and the seat or place as a viewer it holds in its room, from its
+    earlier connection to this one
+
+    Args:
+        session (Session): the session being taken over
+    """
+    old_socket = session.socket or session.old_socket
+    connected = session.socket is not None
+    # the old connection may still look open, close it so its thread ends
+    if connected:
+        online_users.pop(old_socket, None)
+        try:
+            old_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    session.socket = client_socket
+    attach_session(client_socket, session)
+
+    # take back the seat held in the room
+    room = rooms.get(session.room)
+    if room and old_socket in room.p_sockets:
+        room.p_sockets[room.p_sockets.index(old_socket)] = client_socket
+    elif room and old_socket in room.viewers:
+        room.viewers[client_socket] = room.viewers.pop(old_socket)
+        if old_socket in room.streams:
+            del room.streams[old_socket]
+            room.streams[client_socket] = None
+    else:
+        leave_room(client_socket)
+        return
+
+    # a command the old connection holds in the room is let go, as it no longer has
+    # the seat, so its thread ends
+    if connected:
+        room.signal.notify()
+
+def attach_session(client_socket: socket.socket, session: Session) -> None:
+    """
+    Makes session the client's, ending the session the client was logged in with
+    before, if any, so it can not be resumed once replaced
+
+    Args:
+        session (Session): the session the client is now logged in with
+    """
+    previous = online_users.get(client_socket)
+    if previous and previous is not session:
+        sessions.pop(previous.token, None)
+    online_users[client_socket] = session
+
+def game_msg(client_socket: socket.socket) -> str:
+    """
+    Creates the end of an acknowledgement returning a client to a game in progress,
+    naming its room, followed by the inprogress message and the board, or a snapshot
+    for a streaming viewer
+
+    Returns:
+        the message, else empty string if the client is not in a game in progress
+    """
+    room_name = current_room(client_socket)
+    room = rooms.get(room_name)
+    if not room or len(room.players) != 2:
+        return ""
+    msg = ':' + room_name + '\n' + room_header("INPROGRESS", room) + '\n'
+    if client_socket in room.streams:
+        return msg + snapshot_msg(room)
+    return msg + board_msg("BOARDSTATUS", room)
+
+def stats(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients stats message, sending a player's game results and rank if a
+    username is given, else the server's metrics if the client is an admin, else
+    acknowledgement of why it was not possible
+    """
+    if badauth_check(client_socket):
+        return
+
+    msg = msg_recv[0] + ":ACKSTATUS:"
+    # incorrect arguments
+    if len(msg_recv) not in (1, 2):
+        status_info = '2'
+    # player's results
+    elif len(msg_recv) == 2:
+        if find_user(msg_recv[1]):
+            counts, rank = rankings.lookup(msg_recv[1])
+            status_info = '0:' + ':'.join([msg_recv[1]] + [str(count) for count in counts] + \
+[str(rank) if rank else ""])
+        # no user found
+        else:
+            status_info = '3'
+    # not an admin
+    elif online_users[client_socket].username not in admins:
+        status_info = '1'
+    else:
+        summary = metrics.summary()
+        status_info = '0:' + ','.join(f"{name}={value}" for name, value in summary.items())
+
+    client_socket.sendall((msg + status_info).encode())
+
+def leaderboard_msg(count: int) -> bytes:
+    """
+    Gets the acknowledgement listing the best count players, only building it again once
+    the ranking has changed
+
+    Args:
+        count (int): how many players to list
+
+    Returns:
+        encoded acknowledgement
+    """
+    version, msg = leaderboard_cache.get(count, (-1, b""))
+    if version != rankings.version:
+        version = rankings.version
+        players = [
+            '/'.join([username] + [str(result) for result in counts])
+            for username, counts in rankings.top(count)
+        ]
+        msg = ("LEADERBOARD:ACKSTATUS:0:" + ','.join(players)).encode()
+        leaderboard_cache[count] = (version, msg)
+    return msg
+
+def leaderboard(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients leaderboard message, sending the best players with their wins,
+    losses, draws and forfeits, else acknowledgement of why it was not possible
+    """
+    if badauth_check(client_socket):
+        return
+
+    # number of players wanted, 10 if not given
+    count = msg_recv[1] if len(msg_recv) == 2 else "10"
+    # incorrect arguments
+    if len(msg_recv) > 2 or not count.isdecimal() or \
+not 1 <= int(count) <= rankings.MAX_LEADERBOARD:
+        client_socket.sendall((msg_recv[0] + ":ACKSTATUS:1").encode())
+    else:
+        client_socket.sendall(leaderboard_msg(int(count)))
+
+def debug(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients debug message, writing the room table to the server's log if the
+    client is an admin, then sending acknowledgement of whether it was possible
+    """
+    if badauth_check(client_socket):
+        return
+
+    msg = msg_recv[0] + ":ACKSTATUS:"
+    # incorrect arguments
+    if len(msg_recv) != 2 or msg_recv[1] != "ROOMS":
+        status_info = '2'
+    # not an admin
+    elif online_users[client_socket].username not in admins:
+        status_info = '1'
+    else:
+        dump = [
+            f"{room_name}: players={room.players} viewers={list(room.viewers.values())} " \
+f"board={game.board_status(room.game_state, room.size)} turn={room.turn}"
+            for room_name, room in list(rooms.items())
+        ]
+        room_log.info("Room table, %d rooms:\n%s", len(dump), '\n'.join(dump))
+        status_info = '0:' + str(len(dump))
 
     client_socket.sendall((msg + status_info).encode())
 
@@ -142,6 +523,26 @@ def badauth_check(client_socket: socket.socket) -> bool:
         return True
     return False
 
+def read_variant(msg_recv: str) -> tuple[int, int]:
+    """
+    Reads the optional board size and win length of a create message, a 3x3 board with
+    three in a row to win if not given, as in games against the AI
+
+    Returns:
+        (size, win_length), or (0, 0) if they are not a valid variant
+    """
+    if len(msg_recv) == 3:
+        return (game.BOARD_SIZE, game.BOARD_SIZE) if msg_recv[2] == "AI" else (0, 0)
+    if len(msg_recv) != 4:
+        return game.BOARD_SIZE, game.BOARD_SIZE
+    if not msg_recv[2].isdecimal() or not msg_recv[3].isdecimal():
+        return 0, 0
+    size = int(msg_recv[2])
+    win_length = int(msg_recv[3])
+    if not 3 <= win_length <= size <= game.MAX_BOARD_SIZE:
+        return 0, 0
+    return size, win_length
+
 def create(client_socket: socket.socket, msg_recv: str) -> None:
     """
     Interprets clients create message, does requested action if possible, then sends
@@ -151,87 +552,182 @@ def create(client_socket: socket.socket, msg_recv: str) -> None:
         return
 
     msg = msg_recv[0] + ":ACKSTATUS:"
+    size, win_length = read_variant(msg_recv)
+    against_ai = len(msg_recv) == 3
 
     # if invalid format
-    if len(msg_recv) != 2:
+    if len(msg_recv) not in (2, 3, 4) or not size:
         status_info = '4'
     # if too many rooms
-    elif len(rooms) >= 256:
+    elif len(rooms) >= max_rooms:
         status_info = '3'
     # if room name already exists
     elif msg_recv[1] in rooms:
         status_info = '2'
     # if name valid
     elif bool(re.match("^[a-zA-Z0-9 _-]+$", msg_recv[1])):
-        rooms[msg_recv[1]] = {
-            "players": [online_users[client_socket]["username"]],
-            "p_sockets": [client_socket],
-            "viewers": [],
-            "v_sockets": [],
-            "game_state": '',
-            "board_status": "000000000",
-            "turn": 0,
-            "game_begun": False
-        }
-        online_users[client_socket]["room"] = msg_recv[1]
-        online_users[client_socket]["type"] = "P1"
+        rooms[msg_recv[1]] = Room(online_users[client_socket].username, client_socket,
+                                  size, win_length, against_ai)
+        # the AI takes the second seat straight away
+        if against_ai:
+            rooms[msg_recv[1]].players.append(ai.NAME)
+            rooms[msg_recv[1]].p_sockets.append(ai.Seat())
+            rooms[msg_recv[1]].game_begun = True
+            rooms[msg_recv[1]].started = time.time()
+            start_move_clock(msg_recv[1], rooms[msg_recv[1]])
+        online_users[client_socket].room = msg_recv[1]
+        online_users[client_socket].type = "P1"
+        update_lobby(msg_recv[1], not against_ai, True)
         status_info = '0'
     # if invalid
     else:
         status_info = '1'
 
-    client_socket.sendall((msg + status_info).encode())
-    if status_info == '0':
-        begin(client_socket, msg_recv[1])
+    if status_info == '0' and against_ai:
+        msg += status_info + '\n' + room_header("BEGIN", rooms[msg_recv[1]])
+        client_socket.sendall(msg.encode())
+    else:
+        client_socket.sendall((msg + status_info).encode())
 
-def get_player_rooms() -> str:
+def update_lobby(room_name: str, as_player: bool, as_viewer: bool) -> None:
     """
-    Finds all the rooms that are joinable as a player
+    Records whether a room can be joined as a player and as a viewer, called whenever a
+    room is created, filled or ended, so room lists never need to search every room
+
+    Args:
+        room_name (str): holds name of room that changed
+        as_player (bool): whether the room can now be joined as a player
+        as_viewer (bool): whether the room can now be joined as a viewer
+    """
+    global lobby_version
+    with lobby_lock:
+        for mode, joinable in (("PLAYER", as_player), ("VIEWER", as_viewer)):
+            names = lobby_sorted[mode]
+            index = bisect.bisect_left(names, room_name)
+            listed = index < len(names) and names[index] == room_name
+            if joinable and not listed:
+                lobby[mode][room_name] = None
+                names.insert(index, room_name)
+            elif not joinable and listed:
+                lobby[mode].pop(room_name, None)
+                del names[index]
+        lobby_version = next(lobby_versions)
+
+def roomlist_msg(mode: str) -> bytes:
+    """
+    Gets the acknowledgement listing the rooms joinable in mode, only building it again
+    once the lobby has changed
+
+    Args:
+        mode (str): PLAYER or VIEWER
 
     Returns:
-        string of all player joinable room names seperated by commas
+        encoded acknowledgement
     """
-    rooms_list = ""
-    for room in rooms:
-        if len(rooms[room]["players"]) == 1:
-            rooms_list += room + ','
-    return rooms_list[:-1]
+    version, msg = roomlist_cache.get(mode, (-1, b""))
+    if version != lobby_version:
+        with lobby_lock:
+            version = lobby_version
+            msg = ("ROOMLIST:ACKSTATUS:0:" + ','.join(lobby[mode])).encode()
+        roomlist_cache[mode] = (version, msg)
+    return msg
+
+"""
+The following functions use the following args
 
-def get_viewer_rooms() -> str:
+Args:
+    mode (str): PLAYER or VIEWER
+    prefix (str): the start of the room names wanted, empty for all
+    limit (int): the most names to return
+    after (str): the cursor, the last name of the previous page, empty for the first
+"""
+def find_rooms(mode: str, prefix: str, limit: int, after: str) -> list[str]:
     """
-    Finds all the rooms that are joinable as a viewer
+    Finds the rooms in this worker joinable in mode whose names start with prefix, by
+    binary search of the sorted names, so it costs the same however many rooms there are
 
     Returns:
-        string of all viewer joinable room names seperated by commas
+        up to limit + 1 names in name order, so callers can tell if another page follows
+    """
+    with lobby_lock:
+        names = lobby_sorted[mode]
+        start = max(bisect.bisect_left(names, prefix), bisect.bisect_right(names, after))
+        return [name for name in names[start:start + limit + 1] if name.startswith(prefix)]
+
+def room_page(mode: str, prefix: str, limit: int, after: str) -> tuple[list[str], str]:
     """
-    rooms_list = ""
-    for room in rooms:
-        rooms_list += room + ','
-    return rooms_list[:-1]
+    Finds a page of the rooms joinable in mode whose names start with prefix, from every
+    worker
+
+    Returns:
+        the page of names, and the cursor for the next page, empty if this is the last
+    """
+    page = find_rooms(mode, prefix, limit, after)
+    if cluster.count > 1:
+        request = {"kind": "rooms", "mode": mode, "prefix": prefix, "limit": limit, "after": after}
+        for reply in cluster.ask_all(request):
+            page += reply.get("names", [])
+        page = sorted(page)[:limit + 1]
+
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]
+    return page, ""
+
+def all_rooms(mode: str) -> str:
+    """
+    Lists every room joinable in mode, from every worker
+
+    Returns:
+        string of room names seperated by commas
+    """
+    with lobby_lock:
+        rooms_lists = [','.join(lobby[mode])]
+    for reply in cluster.ask_all({"kind": "rooms", "mode": mode}):
+        rooms_lists.append(reply.get("names", ""))
+    return ','.join(rooms_list for rooms_list in rooms_lists if rooms_list)
+
+def answer_rooms(request: dict, fds: list[int]) -> dict:
+    """
+    Answers another worker asking for this worker's rooms, for all_rooms() or room_page()
+
+    Args:
+        request (dict): holds mode, and prefix, limit and after if asking for a page
+
+    Returns:
+        reply holding the names
+    """
+    if "limit" in request:
+        names = find_rooms(request["mode"], request["prefix"], request["limit"], request["after"])
+    else:
+        with lobby_lock:
+            names = ','.join(lobby[request["mode"]])
+    return {"names": names}
 
 def roomlist(client_socket: socket.socket, msg_recv: str) -> None:
     """
     Interprets clients roomlist message, does requested action if possible, then sends
     acknowledgement of action, or why it was not possible
+    ROOMLIST:<mode> lists every joinable room, ROOMLIST:<mode>:<prefix>:<limit>[:<cursor>]
+    lists a page of them
     """
     if badauth_check(client_socket):
         return
 
     msg = msg_recv[0] + ":ACKSTATUS:"
-    # incorrect arguments
-    if len(msg_recv) != 2:
-        status_info = '1'
-    elif msg_recv[1] == "PLAYER":
-        rooms_list = get_player_rooms()
-        status_info = "0:" + rooms_list
-    elif msg_recv[1] == "VIEWER":
-        rooms_list = get_viewer_rooms()
-        status_info = "0:" + rooms_list
-    # if non-existent mode was entered
+    # incorrect arguments or non-existent mode
+    if len(msg_recv) not in (2, 4, 5) or msg_recv[1] not in lobby:
+        client_socket.sendall((msg + '1').encode())
+    elif len(msg_recv) == 2 and cluster.count > 1:
+        client_socket.sendall((msg + '0:' + all_rooms(msg_recv[1])).encode())
+    elif len(msg_recv) == 2:
+        client_socket.sendall(roomlist_msg(msg_recv[1]))
+    # page size out of range
+    elif not msg_recv[3].isdecimal() or not 0 < int(msg_recv[3]) <= MAX_ROOM_PAGE:
+        client_socket.sendall((msg + '1').encode())
     else:
-        status_info = '1'
-
-    client_socket.sendall((msg + status_info).encode())
+        after = msg_recv[4] if len(msg_recv) == 5 else ""
+        page, cursor = room_page(msg_recv[1], msg_recv[2], int(msg_recv[3]), after)
+        client_socket.sendall((msg + '0:' + ','.join(page) + ':' + cursor).encode())
 
 def join(client_socket: socket.socket, msg_recv: str) -> None:
     """
@@ -243,32 +739,39 @@ def join(client_socket: socket.socket, msg_recv: str) -> None:
 
     msg = msg_recv[0] + ":ACKSTATUS:"
 
-    rooms_list_player = get_player_rooms().split(',')
-    rooms_list_viewer = get_viewer_rooms().split(',')
+    # viewers may ask for a snapshot then moves, rather than every board
+    stream = len(msg_recv) == 4 and msg_recv[2] == "VIEWER" and msg_recv[3] == "STREAM"
+
     # incorrect arguments
-    if len(msg_recv) != 3:
+    if len(msg_recv) != 3 and not stream:
         status_info = '3'
     elif msg_recv[2] == "PLAYER":
         # if joinable room - player
-        if msg_recv[1] in rooms_list_player:
-            rooms[msg_recv[1]]["players"].append(online_users[client_socket]["username"])
-            rooms[msg_recv[1]]["p_sockets"].append(client_socket)
-            online_users[client_socket]["room"] = msg_recv[1]
-            online_users[client_socket]["type"] = "P2"
+        if msg_recv[1] in lobby["PLAYER"]:
+            rooms[msg_recv[1]].players.append(online_users[client_socket].username)
+            rooms[msg_recv[1]].p_sockets.append(client_socket)
+            rooms[msg_recv[1]].game_begun = True
+            rooms[msg_recv[1]].started = time.time()
+            rooms[msg_recv[1]].signal.notify()
+            start_move_clock(msg_recv[1], rooms[msg_recv[1]])
+            online_users[client_socket].room = msg_recv[1]
+            online_users[client_socket].type = "P2"
+            update_lobby(msg_recv[1], False, True)
             status_info = '0'
         # if room full
-        elif msg_recv[1] in rooms_list_viewer:
+        elif msg_recv[1] in lobby["VIEWER"]:
             status_info = '2'
         # if room not found - player
         else:
             status_info = '1'
     elif msg_recv[2] == "VIEWER":
         # if joinable room - viewer
-        if msg_recv[1] in rooms_list_viewer: # kind of repetitive
-            rooms[msg_recv[1]]["viewers"].append(online_users[client_socket]["username"])
-            rooms[msg_recv[1]]["v_sockets"].append(client_socket)
-            online_users[client_socket]["room"] = msg_recv[1]
-            online_users[client_socket]["type"] = msg_recv[2]
+        if msg_recv[1] in lobby["VIEWER"]:
+            rooms[msg_recv[1]].viewers[client_socket] = online_users[client_socket].username
+            if stream:
+                rooms[msg_recv[1]].streams[client_socket] = None
+            online_users[client_socket].room = msg_recv[1]
+            online_users[client_socket].type = msg_recv[2]
             status_info = '0'
         # if room not found - viewer
         else:
@@ -279,221 +782,1068 @@ def join(client_socket: socket.socket, msg_recv: str) -> None:
 
     client_socket.sendall((msg + status_info + '\n').encode())
 
-    # send begin message to room users
-    if status_info == '0':
+    # send begin message to room users, viewers of a room still waiting for its second
+    # player are sent the begin message once they join
+    if status_info == '0' and len(rooms[msg_recv[1]].players) == 2:
         if msg_recv[2] == "PLAYER":
             msg_type = "BEGIN"
         else:
             msg_type = "INPROGRESS"
 
-        player1 = rooms[msg_recv[1]]["players"][0]
-        player2 = rooms[msg_recv[1]]["players"][1]
-        msg = msg_type + ':' + player1 + ':' + player2
+        msg = room_header(msg_type, rooms[msg_recv[1]])
 
         if msg_type == "BEGIN":
-            for socket in rooms[msg_recv[1]]["p_sockets"]:
-                socket.sendall(msg.encode())
-            for socket in rooms[msg_recv[1]]["v_sockets"]:
-                socket.sendall(msg.encode())
+            send_to_room(rooms[msg_recv[1]], msg)
         elif msg_type == "INPROGRESS":
+            # streaming viewers are sent the game so far, which the moves follow on from
+            if stream:
+                msg += '\n' + snapshot_msg(rooms[msg_recv[1]])
             client_socket.sendall(msg.encode())
-        begin(client_socket, msg_recv[1])
 
-def begin(client_socket: socket.socket, room_name: str) -> None:
+def quickplay(client_socket: socket.socket, msg_recv: str) -> None:
+    """
+    Interprets clients quickplay message, seating the client in the room of the player
+    who has waited longest for a game, else in a new room to wait for the next player,
+    then sends acknowledgement naming the room, or why it was not possible
+    Quickplay rooms can only be joined through the queue, so players never race to join
+    When running several workers, the first worker picks the room, and the client is
+    seated by the worker that owns it
     """
-    Handles in room client commands, receiving client data, converting into requested move,
-    then storing for other threads in same room to use
+    if badauth_check(client_socket):
+        return
+
+    msg = msg_recv[0] + ":ACKSTATUS:"
+    session = online_users[client_socket]
+    room = None # the room whose game begins, if the client is matched
+
+    # incorrect arguments
+    if len(msg_recv) != 1:
+        status_info = '2'
+    else:
+        room_name = session.room or match_quickplay()
+        # the player matched with is still waiting, so the game begins
+        if room_name in quickplay_rooms:
+            del quickplay_rooms[room_name]
+            room = rooms[room_name]
+            room.players.append(session.username)
+            room.p_sockets.append(client_socket)
+            room.game_begun = True
+            room.started = time.time()
+            room.signal.notify()
+            start_move_clock(room_name, room)
+            session.room = room_name
+            session.type = "P2"
+            status_info = '0:' + room_name
+        # if too many rooms, or a room of that name was made with create
+        elif len(rooms) >= max_rooms or room_name in rooms:
+            session.room = ""
+            status_info = '1'
+        # wait in a new room, queued once it exists so no one is matched with it sooner
+        else:
+            rooms[room_name] = Room(session.username, client_socket)
+            quickplay_rooms[room_name] = None
+            session.room = room_name
+            session.type = "P1"
+            update_lobby(room_name, False, True)
+            queue_quickplay(room_name, True)
+            status_info = '0:' + room_name
+
+    client_socket.sendall((msg + status_info + '\n').encode())
+
+    # send begin message to both players
+    if room:
+        send_to_room(room, room_header("BEGIN", room))
+
+def match_quickplay() -> str:
+    """
+    Picks the room for a player who quick plays, called by the worker keeping the queue
+
+    Returns:
+        name of the room whose player has waited longest, else of a new room to wait in
+    """
+    # other workers may add to or take from the queue at the same time
+    try:
+        room_name, _ = quickplay_queue.popitem(last=False)
+        return room_name
+    except KeyError:
+        pass
+    room_name = "quickplay-" + str(next(quickplay_ids))
+    while room_name in rooms:
+        room_name = "quickplay-" + str(next(quickplay_ids))
+    return room_name
+
+def queue_quickplay(room_name: str, waiting: bool) -> None:
+    """
+    Adds a quickplay room to the queue, or takes it out, asking the first worker to if
+    it is another worker's room
+
+    Args:
+        room_name (str): holds name of the quickplay room
+        waiting (bool): whether its player is waiting to be matched
+    """
+    if cluster.index != 0:
+        send_quickplay({"kind": "quickplay", "room": room_name, "waiting": waiting})
+    elif waiting:
+        quickplay_queue[room_name] = None
+    else:
+        quickplay_queue.pop(room_name, None)
+
+def send_quickplay(request: dict) -> None:
+    """
+    Sends a change to the quickplay queue to the first worker, replaced by the asyncio
+    engine with one sent by a thread, so the event loop never waits on another worker
+
+    Args:
+        request (dict): the change, for answer_quickplay()
+    """
+    try:
+        cluster.send_request(0, request)
+    except (OSError, ValueError) as e:
+        cluster_log.warning("Could not update the quickplay queue: %s", e)
+
+def answer_quickplay(request: dict, fds: list[int]) -> dict:
+    """
+    Answers another worker adding one of its quickplay rooms to the queue, or taking one out
+
+    Args:
+        request (dict): holds room, and waiting, for queue_quickplay()
+
+    Returns:
+        empty reply
+    """
+    queue_quickplay(request["room"], request["waiting"])
+    return {}
+
+def room_header(msg_type: str, room: Room) -> str:
+    """
+    Creates the begin or inprogress message naming the room's players, followed by the
+    board size and win length if the room is not a 3x3 game
+
+    Args:
+        room (Room): the room whose game is beginning or in progress
+
+    Returns:
+        the message
+    """
+    msg = msg_type + ':' + room.players[0] + ':' + room.players[1]
+    if room.size != game.BOARD_SIZE or room.win_length != game.BOARD_SIZE:
+        msg += ':' + str(room.size) + ':' + str(room.win_length)
+    return msg
+
+def snapshot_msg(room: Room) -> str:
+    """
+    Creates the snapshot message sent to streaming viewers, holding the number of moves
+    made, which each move message after it counts on from, the seat of the player to
+    move and the board
+
+    Args:
+        room (Room): the room being viewed
+
+    Returns:
+        the message
+    """
+    return "SNAPSHOT:" + str(len(room.moves)) + ':' + str(room.turn % 2) + ':' + \
+game.board_status(room.game_state, room.size)
+
+def board_msg(msg_type: str, room: Room) -> str:
+    """
+    Creates a boardstatus message, or the start of a gameend message, holding the board
+
+    Args:
+        msg_type (str): BOARDSTATUS or GAMEEND
+        room (Room): the room whose board is sent
+
+    Returns:
+        the message
+    """
+    return msg_type + ':' + game.board_status(room.game_state, room.size)
+
+def current_room(client_socket: socket.socket) -> str:
+    """
+    Finds the room the client is currently in
+
+    Returns:
+        name of the room, else empty string if not logged in or not in a room
+    """
+    if client_socket not in online_users:
+        return ""
+    return online_users[client_socket].room
+
+def leave_room(client_socket: socket.socket) -> None:
+    """
+    Returns the client to the lobby once their game is over
+    """
+    if client_socket in online_users:
+        online_users[client_socket].room = ""
+        online_users[client_socket].type = ""
+
+def send_to_room(room: Room, msg: str, exclude: socket.socket = None,
+                 delta: str = "") -> None:
+    """
+    Queues msg for every player and viewer in the room, so a client that is slow to read
+    can not hold up the sender's turn
+    Viewers already viewer_queue_limit messages behind are only sent the latest board,
+    or are dropped, depending on slow_viewer_policy
+
+    Args:
+        room (Room): the room to send to
+        exclude (socket.socket): a client not to send to
+        delta (str): the move message sent to streaming viewers in place of msg, if any
+    """
+    for client in room.p_sockets:
+        if client is not exclude:
+            client.sendall(msg.encode())
+
+    coalesce = slow_viewer_policy == "coalesce"
+    for client in list(room.viewers):
+        if client is exclude:
+            continue
+        viewer_msg = delta if delta and client in room.streams else msg
+        if not client.sendall(viewer_msg.encode(), viewer_queue_limit, coalesce):
+            viewer_log.warning("Dropping slow viewer: %s", \
+getattr(online_users.get(client), "username", ""))
+            metrics.count("slow_viewers_dropped")
+            # taken out of the room, so later moves do not drop it again
+            del room.viewers[client]
+            room.streams.pop(client, None)
+            client.shutdown(socket.SHUT_RDWR)
+
+def may_move(client_socket: socket.socket, room_name: str, room: Room) -> bool:
+    """
+    Checks if a held in room command can be handled yet, i.e. the game has begun and it
+    is the client's turn, or the game the command was sent to has already ended, or the
+    client no longer holds its place in the room, having been dropped or resumed from
+    another connection
+
+    Args:
+        room_name (str): holds name of room the client is in
+        room (Room): the room when the client entered, to tell it apart from a new room
+                     of the same name
+
+    Returns:
+        True if the command can be handled, else false
+    """
+    if rooms.get(room_name) is not room or not in_room(client_socket, room):
+        return True
+    return room.game_begun and room.p_sockets[room.turn % 2] == client_socket
+
+def in_room(client_socket: socket.socket, room: Room) -> bool:
+    """
+    Checks if a client still holds its seat or place as a viewer in a room
+
+    Args:
+        room (Room): the room the client entered
+
+    Returns:
+        True if the client is in the room and its connection is not closing, else false
+    """
+    if client_socket.closing:
+        return False
+    return client_socket in room.p_sockets or client_socket in room.viewers
+
+def move_position(player_move: list[str], size: int) -> tuple[int, int]:
+    """
+    Reads the column and row of a place message
+
+    Args:
+        player_move (list[str]): the client's in room message split into its arguments
+        size (int): the number of rows and columns of the room's board
+
+    Returns:
+        (col, row), or (-1, -1) if they are not a position on the board
+    """
+    if len(player_move) != 3 or not player_move[1].isdecimal() or not player_move[2].isdecimal():
+        return -1, -1
+    col = int(player_move[1])
+    row = int(player_move[2])
+    if col >= size or row >= size:
+        return -1, -1
+    return col, row
+
+def play_move(client_socket: socket.socket, room_name: str, player_move: list[str]) -> bool:
+    """
+    Converts client data into the requested move and applies it to the room's game
     Upon updated board, sends appropriate message with new board state to all clients in room
-    
+
     Args:
         room_name (str): holds name of room that is being handled
-    """
-    # if board not created, create it
-    if not rooms[room_name]["game_state"]:
-        rooms[room_name]["game_state"] = game.create_board()
-    players = [game.CROSS, game.NOUGHT]
-    
-    # when second player joins allow first player move
-    if len(rooms[room_name]["players"]) == 2:
-        rooms[room_name]["game_begun"] = True
+        player_move (list[str]): the client's in room message split into its arguments
 
+    Returns:
+        True if the game is over, else false
+    """
+    turn = rooms[room_name].turn
+    bitboards = rooms[room_name].game_state
+    size = rooms[room_name].size
     status_code = ''
-    board_status = ''
-    try:
-        while not status_code:
-            player_move = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
 
-            # if game is over use this input as out of game input
-            if room_name not in rooms:
-                global escp_gm_msg
-                escp_gm_msg = player_move
-                break
+    # update game state according to player move
+    if player_move[0] == "PLACE":
+        col, row = move_position(player_move, size)
+        # moves off the board or on a taken cell are answered with the unchanged board,
+        # so a client waiting on its reply is not left waiting
+        if col < 0 or game.is_occupied(bitboards, col, row, size):
+            client_socket.sendall(board_msg("BOARDSTATUS", rooms[room_name]).encode())
+            return False
+        bitboard = game.place(bitboards, turn % 2, col, row, size)
+        rooms[room_name].moves.append(size * row + col)
+
+        # check if the game is over, only the lines through the new stone can have won
+        if game.wins_through(bitboard, col, row, size, rooms[room_name].win_length):
+            msg_type = "GAMEEND"
+            status_code = '0'
+        elif game.bitboards_draw(bitboards, size):
+            msg_type = "GAMEEND"
+            status_code = '1'
+        else:
+            msg_type = "BOARDSTATUS"
 
-            # hold move if game not begun
-            while rooms[room_name]["game_begun"] == False:
-                continue
+    elif player_move[0] == "FORFEIT":
+        msg_type = "GAMEEND"
+        status_code = '2'
 
-            # hold move if not turn
-            while rooms[room_name]["p_sockets"][rooms[room_name]["turn"] % 2] != client_socket:
-                continue
+    # not an in room command
+    else:
+        return False
+
+    # construct message to send, streaming viewers are only sent the move
+    msg = board_msg(msg_type, rooms[room_name])
+    delta = ""
+    if msg_type == "BOARDSTATUS":
+        delta = "MOVE:" + str(len(rooms[room_name].moves)) + ':' + str(size * row + col)
+    if status_code:
+        rooms[room_name].game_begun = False
+        msg += ':' + status_code
+        if status_code == '0':
+            msg += ':' + rooms[room_name].players[turn % 2]
+        elif status_code == '2':
+            msg += ':' + rooms[room_name].players[(turn + 1) % 2]
+
+    send_to_room(rooms[room_name], msg, delta=delta)
+
+    rooms[room_name].turn = turn + 1
+
+    game_over = msg_type == "GAMEEND"
+    if game_over:
+        winner = turn % 2 if status_code == '0' else (turn + 1) % 2
+        record_game(room_name, int(status_code), winner)
+        update_lobby(room_name, False, False)
+        rooms.pop(room_name, None).signal.notify()
+    else:
+        rooms[room_name].signal.notify()
+        # the AI answers each move straight away, in the thread of the player it answers
+        if rooms[room_name].ai and turn % 2 == 0:
+            return ai_move(room_name)
+        start_move_clock(room_name, rooms[room_name])
+    return game_over
+
+def record_game(room_name: str, status_code: int, winner: int) -> None:
+    """
+    Queues a room's finished game to be written to the game history, and counts it in
+    each player's results, the AI's results are not counted
 
-            # update boardstatus and game state according to player move
-            if player_move[0] == "PLACE":
-                board = rooms[room_name]["game_state"]
-                board_status = rooms[room_name]["board_status"]
-                turn = rooms[room_name]["turn"]
-
-                player = players[turn % 2]
-                col = int(player_move[1])
-                row = int(player_move[2])
-                position = game.player_turn(player, board, col, row)
-
-                board_status = list(board_status)
-                board_status[3 * row + col] = str(turn % 2 + 1)
-                board_status = ''.join(board_status)
-
-                rooms[room_name]["game_state"] = board
-                rooms[room_name]["board_status"] = board_status
-
-                # check if the game is over
-                if game.player_wins(player, board):
-                    msg_type = "GAMEEND"
-                    status_code = '0'
-                elif game.players_draw(board):
-                    msg_type = "GAMEEND"
-                    status_code = '1'
-                else:
-                    player = game.NOUGHT if player == game.CROSS else game.CROSS
-                    msg_type = "BOARDSTATUS"
-
-            elif player_move[0] == "FORFEIT":
-                board_status = rooms[room_name]["board_status"]
-                msg_type = "GAMEEND"
-                status_code = '2'
-
-            elif player_move[0] == "":
-                raise OSError
+    Args:
+        room_name (str): holds name of the room whose game is over
+        status_code (int): the gameend status code
+        winner (int): index of the winning player, ignored for a draw
+    """
+    room = rooms[room_name]
+    history.record(room_name, room.players, room.moves, status_code,
+                   history.NO_WINNER if status_code == 1 else winner, room.size,
+                   room.win_length, room.started)
 
-            # construct message to send
-            msg = msg_type + ':'  + board_status
-            if status_code:
-                rooms[room_name]["game_begun"] = False
-                turn = rooms[room_name]["turn"]
-                msg += ':' + status_code
-                if status_code == '0':
-                    msg += ':' + rooms[room_name]["players"][turn % 2]
-                elif status_code == '2':
-                    msg += ':' + rooms[room_name]["players"][(turn + 1) % 2]
+    if status_code == 1:
+        results = [rankings.DRAW, rankings.DRAW]
+    else:
+        results = [rankings.LOSS if status_code == 0 else rankings.FORFEIT] * 2
+        results[winner] = rankings.WIN
+    for seat, username in enumerate(room.players):
+        if not (room.ai and seat == 1):
+            rankings.record(username, results[seat])
 
-            for socket in rooms[room_name]["p_sockets"]:
-                socket.sendall(msg.encode())
-            for socket in rooms[room_name]["v_sockets"]:
-                socket.sendall(msg.encode())
+def ai_move(room_name: str) -> bool:
+    """
+    Plays the AI's move, looked up from its table, in the room
 
-            rooms[room_name]["turn"] = turn + 1
+    Args:
+        room_name (str): holds name of the room the AI is playing in
 
-            if msg_type == "GAMEEND":
-                rooms.pop(room_name, None)
+    Returns:
+        True if the game is over, else false
+    """
+    room = rooms[room_name]
+    col, row = ai.best_move(room.game_state)
+    return play_move(room.p_sockets[1], room_name, ["PLACE", str(col), str(row)])
 
-    except OSError:
-        print("Client disconnected")
+def player_left(client_socket: socket.socket, room_name: str, room: Room) -> None:
+    """
+    Handles a client disconnecting from a room, forfeiting the game if they were a player
+
+    Args:
+        room_name (str): holds name of room the client was in
+        room (Room): the room when the client entered
+    """
+    with room.signal:
+        # game already over
+        if rooms.get(room_name) is not room:
+            return
 
         # send to everyone else forfeit
-        if client_socket in rooms[room_name]["p_sockets"]:
-            winner_index = (rooms[room_name]["p_sockets"].index(client_socket) + 1) % 2
-            msg = "GAMEEND:" + rooms[room_name]["board_status"] + ":2:" + \
-rooms[room_name]["players"][winner_index]
-
-            for socket in rooms[room_name]["p_sockets"]:
-                if socket != client_socket:
-                    socket.sendall(msg.encode())
-            for socket in rooms[room_name]["v_sockets"]:
-                socket.sendall(msg.encode())
+        if client_socket in room.p_sockets:
+            winner_index = (room.p_sockets.index(client_socket) + 1) % 2
+            winner = room.players[winner_index] if len(room.players) == 2 else ""
+            msg = board_msg("GAMEEND", room) + ":2:" + winner
+
+            send_to_room(room, msg, client_socket)
+            # rooms still waiting for a second player never held a game
+            if len(room.players) == 2:
+                record_game(room_name, 2, winner_index)
+            if room_name in quickplay_rooms:
+                del quickplay_rooms[room_name]
+                queue_quickplay(room_name, False)
+            update_lobby(room_name, False, False)
+            rooms.pop(room_name, None)
+            room.signal.notify()
         # if viewer disconnected
-        elif client_socket in rooms[room_name]["v_sockets"]:
-            v_index = rooms[room_name]["v_sockets"].index(client_socket)
-            rooms[room_name]["v_sockets"][v_index]
-            rooms[room_name]["viewers"][v_index]
+        elif client_socket in room.viewers:
+            del room.viewers[client_socket]
+            room.streams.pop(client_socket, None)
+
+def begin(client_socket: socket.socket, room_name: str) -> list[str]:
+    """
+    Handles in room client commands, receiving client data and holding it until it is
+    the client's turn, then applying it to the room's game
+
+    Args:
+        room_name (str): holds name of room that is being handled
+
+    Returns:
+        message received after the game ended, to be handled as an out of game command
+    """
+    room = rooms[room_name]
+    while True:
+        player_move = client_socket.recv_msg()
+        if player_move[0] == "":
+            raise OSError
+
+        # viewers that missed a move are sent the game again straight away
+        if player_move[0] == "RESYNC" and rooms.get(room_name) is room:
+            client_socket.sendall(snapshot_msg(room).encode())
+            continue
+
+        # hold move if game not begun or not turn, then make it holding the room
+        with room.signal:
+            room.signal.wait_for(lambda: may_move(client_socket, room_name, room))
+
+            # if game is over use this input as out of game input
+            if rooms.get(room_name) is not room:
+                leave_room(client_socket)
+                return player_move
+            # if dropped or resumed elsewhere the connection is done with
+            if not in_room(client_socket, room):
+                raise OSError
+
+            start = time.perf_counter()
+            game_over = play_move(client_socket, room_name, player_move)
+        metrics.observe("move", command_name(player_move), time.perf_counter() - start)
+        if game_over:
+            leave_room(client_socket)
+            return []
+
+def start_move_clock(room_name: str, room: Room) -> None:
+    """
+    Gives the player to move move_timeout seconds to move, else they forfeit
+
+    Args:
+        room_name (str): holds name of the room whose turn has begun
+        room (Room): the room, to tell it apart from a new room of the same name
+    """
+    if move_timeout:
+        turn = room.turn
+        call_later(move_timeout, lambda: move_clock(room_name, room, turn))
+
+def move_clock(room_name: str, room: Room, turn: int) -> None:
+    """
+    Forfeits the game for a player whose move clock ran out, sending the gameend message
+    to the room, unless they have moved or the game is over
+
+    Args:
+        turn (int): the turn the clock was started for
+    """
+    with room.signal:
+        if rooms.get(room_name) is not room or room.turn != turn or not room.game_begun:
+            return
+        room_log.info("Player %s ran out of time in room %s", room.players[turn % 2],
+                      room_name)
+        metrics.count("move_timeouts")
+        play_move(room.p_sockets[turn % 2], room_name, ["FORFEIT"])
+
+def watch_client(client_socket: socket.socket) -> None:
+    """
+    Starts a newly connected client's login deadline and idle timeout
+    Each client only ever has one timer of each, the idle timer is moved on when it
+    finds the client has sent something, rather than each time they send
+    """
+    if login_timeout:
+        client_socket.timers["login"] = \
+call_later(login_timeout, lambda: login_deadline(client_socket))
+    if idle_timeout:
+        client_socket.timers["idle"] = \
+call_later(idle_timeout, lambda: check_idle(client_socket))
+
+def unwatch_client(client_socket: socket.socket) -> None:
+    """
+    Cancels a client's timers once it has disconnected or been handed to another
+    worker, so they no longer hold on to the connection
+    """
+    for timer in client_socket.timers.values():
+        timer.cancel()
+    client_socket.timers.clear()
 
-        rooms.pop(room_name, None)
+def drop_client(client_socket: socket.socket, reason: str) -> None:
+    """
+    Closes a client's connection, ending its recv so it is handled as a disconnect
 
-def handle_client(client_socket: socket.socket, client_address: tuple[str, int]) -> None:
+    Args:
+        reason (str): the metric counting why clients are dropped
+    """
+    connection_log.info("Dropping client: %s", reason)
+    metrics.count(reason)
+    client_socket.shutdown(socket.SHUT_RDWR)
+    wake_room(client_socket)
+
+def wake_room(client_socket: socket.socket) -> None:
+    """
+    Wakes the commands held in the client's room, so one held for the client sees that
+    it is no longer in the room
+    """
+    session = online_users.get(client_socket)
+    room = rooms.get(session.room) if session else None
+    if room:
+        room.signal.notify()
+
+def login_deadline(client_socket: socket.socket) -> None:
+    """
+    Drops a client that has not logged in within login_timeout seconds of connecting
+    """
+    if not client_socket.closing and client_socket not in online_users:
+        drop_client(client_socket, "login_timeouts")
+
+def check_idle(client_socket: socket.socket) -> None:
+    """
+    Drops a client that has sent nothing for idle_timeout seconds while out of a game,
+    else checks again once they could next have been idle that long
+    Players and viewers of a game that has begun are never idle, as they may only be
+    waiting for moves, so their time out of a game is counted from when it was last
+    checked
+    """
+    # the client has disconnected, so its timers were cancelled
+    if client_socket.closing or "idle" not in client_socket.timers:
+        return
+    now = time.monotonic()
+    room = rooms.get(current_room(client_socket))
+    if room and len(room.players) == 2:
+        client_socket.active = now
+    elif now - client_socket.active >= idle_timeout:
+        drop_client(client_socket, "idle_timeouts")
+        return
+    client_socket.timers["idle"] = \
+call_later(client_socket.active + idle_timeout - now, lambda: check_idle(client_socket))
+
+def expire_session(token: str) -> None:
+    """
+    Ends a dropped client's session if it was not resumed in time, forfeiting their seat
+
+    Args:
+        token (str): the session's token
+    """
+    session = sessions.get(token)
+    if session and held_players.get(session.username) == token:
+        del held_players[session.username]
+    if not session or session.socket or time.monotonic() < session.expires:
+        return
+
+    del sessions[token]
+    room_name = session.room
+    room = rooms.get(room_name)
+    if room:
+        player_left(session.old_socket, room_name, room)
+
+def disconnect(client_socket: socket.socket) -> None:
+    """
+    Handles a client's connection closing, holding their session and seat for the grace
+    period so they can RESUME, else leaving their room straight away
+    """
+    unwatch_client(client_socket)
+    wake_room(client_socket)
+    session = online_users.pop(client_socket, None)
+    # not logged in, or connection was replaced by a resume, or the server is stopping
+    # and the seat is kept for the snapshot
+    if not session or session.socket is not client_socket or draining:
+        return
+
+    # a player waiting for a quickplay match is not held, so no one is matched with them
+    if session_grace > 0 and session.room not in quickplay_rooms:
+        session.socket = None
+        session.old_socket = client_socket
+        session.expires = time.monotonic() + session_grace
+        call_later(session_grace, lambda: expire_session(session.token))
+        return
+
+    sessions.pop(session.token, None)
+    room_name = session.room
+    room = rooms.get(room_name)
+    if room:
+        connection_log.info("Player left room %s by disconnecting", room_name)
+        player_left(client_socket, room_name, room)
+
+def save_rooms(path: str) -> int:
+    """
+    Writes every room to a snapshot, along with the session tokens of its players, so
+    they can take back their seats once the rooms are restored
+    Quickplay rooms still waiting for their second player are left out, as the player
+    waiting is never held
+
+    Args:
+        path (str): path of the snapshot
+
+    Returns:
+        number of rooms written
+    """
+    tokens = {
+        session.socket or session.old_socket: session.token
+        for session in list(sessions.values())
+    }
+    records = [
+        snapshot.encode_room(room_name, room.players,
+                             [tokens.get(seat, "") for seat in room.p_sockets], room.moves,
+                             room.size, room.win_length, room.ai, room.started)
+        for room_name, room in list(rooms.items()) if room_name not in quickplay_rooms
+    ]
+    snapshot.write(path, records)
+    return len(records)
+
+def restore_rooms(path: str) -> int:
+    """
+    Recreates the rooms in a snapshot, holding each player's session and seat for
+    restore_grace seconds for them to RESUME or log in again, after which they forfeit
+    The snapshot is deleted once read, so it is only ever restored once
+
+    Args:
+        path (str): path of the snapshot
+
+    Returns:
+        number of rooms restored
+    """
+    global lobby_version
+    if not os.path.exists(path):
+        return 0
+
+    expires = time.monotonic() + restore_grace
+    tokens = []
+    restored = []
+    # the collector is paused while the rooms are made, else it scans the rooms already
+    # made again and again, taking longer than making them
+    gc.disable()
+    try:
+        for saved in snapshot.read(path):
+            room_name = saved["room"]
+            room = Room(saved["players"][0], RestoredSeat(), saved["size"], saved["win_length"],
+                        saved["ai"])
+            if len(saved["players"]) == 2:
+                room.players.append(saved["players"][1])
+                room.p_sockets.append(ai.Seat() if room.ai else RestoredSeat())
+                room.game_begun = True
+            # the board and turn follow from the moves
+            for turn, cell in enumerate(saved["moves"]):
+                room.game_state[turn % 2] |= 1 << cell
+            room.moves = saved["moves"]
+            room.turn = len(room.moves)
+            room.started = saved["started"]
+            rooms[room_name] = room
+
+            for seat, token in enumerate(saved["tokens"]):
+                if not token:
+                    continue
+                session = Session(room.players[seat], token, None)
+                session.room = room_name
+                session.type = "P" + str(seat + 1)
+                session.old_socket = room.p_sockets[seat]
+                session.expires = expires
+                sessions[token] = session
+                held_players[session.username] = token
+                tokens.append(token)
+
+            if len(room.players) == 1:
+                lobby["PLAYER"][room_name] = None
+            lobby["VIEWER"][room_name] = None
+            restored.append((room_name, room))
+    finally:
+        gc.enable()
+
+    # the lobby is sorted once, rather than as each room is added
+    for mode in lobby:
+        lobby_sorted[mode] = sorted(lobby[mode])
+    lobby_version = next(lobby_versions)
+    # one timer for every restored room, rather than one for each session
+    call_later(restore_grace, lambda: end_restore_grace(tokens, restored))
+    os.remove(path)
+    return len(restored)
+
+def end_restore_grace(tokens: list[str], restored: list[tuple[str, Room]]) -> None:
+    """
+    Ends the sessions of restored rooms' players who have not returned, forfeiting their
+    games, then starts the move clocks of the games still in progress
+
+    Args:
+        tokens (list[str]): the sessions held for the players of the restored rooms
+        restored (list[tuple[str, Room]]): the restored rooms and their names
+    """
+    for token in tokens:
+        expire_session(token)
+    for room_name, room in restored:
+        if rooms.get(room_name) is room and room.game_begun:
+            start_move_clock(room_name, room)
+
+def drain(drop_clients: bool = True) -> None:
+    """
+    Saves the rooms to the snapshot, if there is one, when the server is stopping
+    Clients are dropped first without leaving their rooms, so no move is made once the
+    rooms are saved, and they reconnect to the next server
+
+    Args:
+        drop_clients (bool): whether to drop the clients, false once the asyncio
+                             engine's tasks have been cancelled
+    """
+    global draining
+    if not snapshot_path:
+        return
+    draining = True
+    if drop_clients:
+        for client_socket in list(online_users):
+            client_socket.shutdown(socket.SHUT_RDWR)
+
+    start = time.perf_counter()
+    count = save_rooms(snapshot_path)
+    room_log.info("Saved %d rooms to %s in %.3fs", count, snapshot_path,
+                  time.perf_counter() - start)
+
+def command_name(msg_recv: list[str]) -> str:
+    """
+    Names a command for its metrics, unknown commands share one name so clients can not
+    create endless metrics
+
+    Returns:
+        the command's keyword, DISCONNECT for a closed connection or UNKNOWN
+    """
+    if msg_recv[0] == "":
+        return "DISCONNECT"
+    if msg_recv[0] in msg_to_func or msg_recv[0] in ("PLACE", "FORFEIT", "RESYNC"):
+        return msg_recv[0]
+    return "UNKNOWN"
+
+def dispatch(client_socket: socket.socket, msg_recv: list[str]) -> None:
+    """
+    Runs the appropriate function for an out of room command, timing it
+    """
+    start = time.perf_counter()
+    try:
+        # make in room commands not accessible
+        if msg_recv[0] in ("PLACE", "FORFEIT", "RESYNC"):
+            if not badauth_check(client_socket):
+                client_socket.sendall("NOROOM".encode())
+        elif msg_recv[0] in msg_to_func:
+            msg_to_func[msg_recv[0]](client_socket, msg_recv)
+        else:
+            command_log.info("Unknown command: %s", msg_recv[0])
+    finally:
+        metrics.observe("command", command_name(msg_recv), time.perf_counter() - start)
+
+def route(client_socket: socket.socket, msg_recv: list[str], resume_hops: int = 0) -> int:
+    """
+    Finds the worker that should handle an out of room command, so all of a room's
+    players and viewers are in the worker that owns it
+
+    Args:
+        resume_hops (int): number of workers already asked for the session being resumed
+
+    Returns:
+        index of the worker, or -1 if this worker handles it
+    """
+    worker = -1
+    if cluster.count == 1:
+        return worker
+
+    if msg_recv[0] in ("CREATE", "JOIN") and len(msg_recv) > 1 and client_socket in online_users:
+        worker = cluster.owner(msg_recv[1])
+    # the first worker holds the quickplay queue, so any two players can be matched, and
+    # hands each player to the worker owning the room it picks
+    elif msg_recv[0] == "QUICKPLAY" and client_socket in online_users:
+        session = online_users[client_socket]
+        if cluster.index == 0 and len(msg_recv) == 1 and not session.room:
+            session.room = match_quickplay()
+        worker = cluster.owner(session.room) if session.room else 0
+    # a session is held by the worker its client was last in, so each is asked in turn
+    elif msg_recv[0] == "RESUME" and len(msg_recv) == 2 and msg_recv[1] not in sessions \
+and resume_hops < cluster.count - 1:
+        worker = (cluster.index + 1) % cluster.count
+    return -1 if worker == cluster.index else worker
+
+def export_client(client_socket: socket.socket, msg_recv: list[str], resume_hops: int) -> dict:
+    """
+    Removes a client being handed to another worker from this worker's records
+
+    Returns:
+        the client's state and the command it sent, for restore_client()
+    """
+    unwatch_client(client_socket)
+    session = online_users.pop(client_socket, None)
+    if session:
+        sessions.pop(session.token, None)
+    return {
+        "kind": "adopt",
+        "msg": msg_recv,
+        "version": client_socket.version,
+        "buffer": client_socket.unread().decode("latin-1"),
+        "resume_hops": resume_hops + 1 if msg_recv[0] == "RESUME" else 0,
+        "user": session.export() if session else None
+    }
+
+def restore_client(client_socket: socket.socket, state: dict) -> list[str]:
+    """
+    Adds a client handed over by another worker to this worker's records
+
+    Args:
+        state (dict): the client's state, from export_client()
+
+    Returns:
+        the command the client sent, to be handled here
+    """
+    client_socket.version = state["version"]
+    client_socket.feed(state["buffer"].encode("latin-1"))
+    user = state["user"]
+    if user:
+        session = Session(user["username"], user["token"], client_socket)
+        session.room = user["room"]
+        session.type = user["type"]
+        online_users[client_socket] = sessions[session.token] = session
+    return state["msg"]
+
+def hand_off(client_socket: socket.socket, msg_recv: list[str], worker: int,
+             resume_hops: int) -> None:
+    """
+    Passes a client and the command it sent to another worker, once everything queued
+    for the client has been written
+    """
+    sock = client_socket.detach()
+    state = export_client(client_socket, msg_recv, resume_hops)
+    try:
+        cluster.send_request(worker, state, sock.fileno())
+        metrics.count("handoffs")
+    finally:
+        sock.close()
+
+def adopt_client(sock: socket.socket, state: dict) -> None:
+    """
+    Takes over a client handed over by another worker, replaced by the asyncio engine
+    """
+    sock.setblocking(True)
+    threading.Thread(target=handle_client, args=(sock, sock.getpeername(), state),
+                     daemon=True).start()
+
+def answer_adopt(request: dict, fds: list[int]) -> dict:
+    """
+    Answers another worker handing over a client
+
+    Args:
+        request (dict): the client's state, from export_client()
+        fds (list[int]): holds the client's socket
+
+    Returns:
+        empty reply
+    """
+    adopt_client(socket.socket(fileno=fds[0]), request)
+    return {}
+
+msg_to_func = {
+    "": exit_server,
+    "HELLO": hello,
+    "LOGIN": login,
+    "REGISTER": register,
+    "CREATE": create,
+    "ROOMLIST": roomlist,
+    "JOIN": join,
+    "QUICKPLAY": quickplay,
+    "RESUME": resume,
+    "STATS": stats,
+    "LEADERBOARD": leaderboard,
+    "DEBUG": debug
+}
+
+def handle_client(client_socket: socket.socket, client_address: tuple[str, int],
+                  state: dict = None) -> None:
     """
     Get client messages and runs appropriate function in order to interpret data and
     send back appropriate message
-    Does not handle in room functions
+    Hands over to begin() while the client is in a room
 
     Args:
         client_address (tuple[str, int]): holds [0] ip of client [1] port of client
+        state (dict): the client's state, if handed over by another worker
     """
-    msg_to_func = {
-        "": exit_server,
-        "LOGIN": login,
-        "REGISTER": register,
-        "CREATE": create,
-        "ROOMLIST": roomlist,
-        "JOIN": join
-    }
-
     # While client connected
-    print(f"Client connected: {client_address}")
-    client_connected = True
+    connection_log.info("Client connected: %s", client_address)
+    client_socket = protocol.SocketConnection(client_socket)
+    watch_client(client_socket)
+    msg_recv = restore_client(client_socket, state) if state else []
+    resume_hops = state["resume_hops"] if state else 0
 
-    while client_connected:
-        try:
+    try:
+        while True:
             # Recieve message and run appropriate function
-            global escp_gm_msg
-            if escp_gm_msg:
-                msg_recv = escp_gm_msg
-                escp_gm_msg = ""
-            else:
-                msg_recv = client_socket.recv(MAX_MSG_SZ).decode().strip().split(':')
-            print(f"Received data: {msg_recv}")
+            if not msg_recv:
+                msg_recv = client_socket.recv_msg()
+            command_log.debug("Received data: %s", msg_recv)
+
+            # commands for rooms owned by another worker are handled by it
+            worker = route(client_socket, msg_recv, resume_hops)
+            if worker >= 0:
+                hand_off(client_socket, msg_recv, worker, resume_hops)
+                cluster_log.info("Client handed to worker %d: %s", worker, client_address)
+                return
+            resume_hops = 0
+
+            dispatch(client_socket, msg_recv)
+            if msg_recv[0] in ("LOGIN", "REGISTER"):
+                hash_log.info("Hash pool: %s", hasher.stats())
+
+            # the message that escaped a finished game is handled next
+            msg_recv = []
+            room_name = current_room(client_socket)
+            if room_name:
+                msg_recv = begin(client_socket, room_name)
 
-            # make in room commands not accessible
-            if msg_recv[0] == "PLACE" or msg_recv[0] == "FORFEIT":
-                if not badauth_check(client_socket):
-                    client_socket.sendall("NOROOM".encode())
-            else:
-                msg_to_func[msg_recv[0]](client_socket, msg_recv)
-            print(rooms)
+    except OSError:
+        disconnect(client_socket)
+        client_socket.close()
+        connection_log.info("Client disconnected: %s", client_address)
 
-        except OSError:
-            client_connected = False
-            if client_socket in online_users:
-                del online_users[client_socket]
-            client_socket.close()
-            print(f"Client disconnected: {client_address}")
+def setup(config: dict) -> None:
+    """
+    Applies the server config to the module's globals
 
-def main(args: list[str]) -> None:
+    Args:
+        config (dict): the loaded server config
+    """
+    global users, hasher, session_grace, max_rooms, admins, viewer_queue_limit
+    global slow_viewer_policy, login_timeout, idle_timeout, move_timeout, snapshot_path
+    global restore_grace
+    logs.setup(config)
+    ai.load(config.get("aiTable", ""))
+    # workers each keep their own history and snapshot, in files ending in their index
+    suffix = f".{cluster.index}" if cluster.count > 1 else ""
+    if config.get("historyLog"):
+        history.start(config["historyLog"] + suffix)
+    users = user_store.open_store(config.get("userStore", "json"), config["userDatabase"])
+    rankings.setup(users)
+    # the cores are shared between the workers' hash pools
+    hash_workers = config.get("hashWorkers", max(1, os.cpu_count() // cluster.count))
+    hasher = hash_pool.HashPool(hash_workers, config.get("hashQueue", 64))
+    session_grace = config.get("sessionGrace", 30)
+    login_timeout = config.get("loginTimeout", 30)
+    idle_timeout = config.get("idleTimeout", 600)
+    move_timeout = config.get("moveTimeout", 0)
+    restore_grace = config.get("restoreGrace", 120)
+    max_rooms = config.get("maxRooms", 100000)
+    viewer_queue_limit = config.get("viewerQueueLimit", 64)
+    slow_viewer_policy = config.get("slowViewerPolicy", "coalesce")
+    admins = config.get("admins", [])
+    if cluster.count > 1:
+        cluster.serve({"adopt": answer_adopt, "rooms": answer_rooms,
+                       "quickplay": answer_quickplay})
+
+    if config.get("snapshotFile"):
+        snapshot_path = config["snapshotFile"] + suffix
+        start = time.perf_counter()
+        count = restore_rooms(snapshot_path)
+        if count:
+            room_log.info("Restored %d rooms from %s in %.3fs", count, snapshot_path,
+                          time.perf_counter() - start)
+
+    metrics.gauge("online_users", lambda: len(online_users))
+    metrics.gauge("held_sessions", lambda: \
+sum(not session.socket for session in list(sessions.values())))
+    metrics.gauge("rooms", lambda: len(rooms))
+    metrics.gauge("viewers", lambda: sum(len(room.viewers) for room in list(rooms.values())))
+    metrics.gauge("threads", threading.active_count)
+    metrics.gauge("timers", lambda: timers.wheel.pending)
+    for name in ("queue_depth", "in_flight", "rejected", "failed"):
+        metrics.gauge("hash_" + name, lambda name=name: hasher.stats()[name])
+    # workers each serve their own metrics, on the ports following metricsPort
+    if "metricsPort" in config:
+        metrics.serve(config["metricsPort"] + cluster.index)
+
+def run(config: dict) -> None:
     """
     Sets up server, gets user socket then creates thread for handling client messages
+    The asyncio engine is used instead if the config's mode is "asyncio"
 
     Args:
-        args (list[str]): holds [0] server config path
+        config (dict): the loaded server config
     """
-    config = read_json(args[0])
-    port = config["port"]
-    global user_database
-    user_database = os.path.expanduser(config["userDatabase"])
+    if config.get("mode", "threaded") == "asyncio":
+        import async_server
+        async_server.main(config)
+        return
+    setup(config)
+    timers.start()
 
-    # Setting up server
+    # Setting up server, workers each listen on the port and the kernel shares clients out
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind(("", port))
-    server_socket.listen(5)
+    if cluster.count > 1:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind(("", config["port"]))
+    server_socket.listen(socket.SOMAXCONN)
+    server_socket.settimeout(ACCEPT_TIMEOUT)
 
     # Waiting for a client connection
-    while True:
-        try:
-            client_socket, client_address = server_socket.accept()
-            threading.Thread(target=handle_client, args=(client_socket, client_address)).start()
-
-        # If waiting for client and ctrl c - quit cleanly
-        except KeyboardInterrupt:
-            print("\nClosing server...")
-            server_socket.close()
-            sys.exit(0)
+    try:
+        while True:
+            try:
+                client_socket, client_address = server_socket.accept()
+            except socket.timeout:
+                continue
+            threading.Thread(target=handle_client, args=(client_socket, client_address),
+                             daemon=True).start()
+
+    # If waiting for client and ctrl c - stop accepting clients and quit cleanly
+    except KeyboardInterrupt:
+        print("\nClosing server...")
+        server_socket.close()
+        drain()
+        hasher.shutdown()
+        history.stop()
+        users.flush()
+        sys.exit(0)
+
+def main(args: list[str]) -> None:
+    """
+    Runs the server, in the number of worker processes set by the config's workers
+
+    Args:
+        args (list[str]): holds [0] server config path
+    """
+    config = read_json(args[0])
+    workers = config.get("workers", 1)
+    if workers == 1:
+        run(config)
+    # workers share registered users through the database, which only sqlite allows
+    elif config.get("userStore", "json") != "sqlite":
+        print("Error: Running more than one worker needs the sqlite userStore", file=sys.stderr)
+        sys.exit(1)
+    else:
+        cluster.supervise(workers, lambda: run(config))
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,115 @@
+# imports
+import os
+import mmap
+import struct
+from array import array
+from typing import Iterator, Optional
+import protocol
+
+# constants and globals
+MAGIC = b"TTTS" # first bytes of every snapshot
+FORMAT_VERSION = 1
+# magic, format version, number of rooms
+FILE_HEADER = struct.Struct("<4sBI")
+# started, board size, win length, whether the AI holds the second seat, number of moves
+ROOM_HEADER = struct.Struct("<dBB?H")
+
+"""
+A snapshot holds every live room of a server that is stopping, so the next server can
+restore them. Each room is a record prefixed by its length, as in the game history,
+holding its board size, win length, moves and the names and session tokens of its
+players. Boards and turns are not stored, as both follow from the moves
+
+All of the following functions use one or more of these args
+
+Args:
+    path (str): path of the snapshot
+    room_name (str): name of the room
+    players (list[str]): usernames of the room's players, in seat order
+    tokens (list[str]): session token of each player, empty for the AI
+    moves (list[int]): cell of each move in order, size * row + col
+"""
+def encode_room(room_name: str, players: list[str], tokens: list[str], moves: list[int],
+                size: int, win_length: int, against_ai: bool, started: float) -> bytes:
+    """
+    Encodes a room as a record of the snapshot
+
+    Args:
+        against_ai (bool): whether the AI holds the second seat
+        started (float): time the game began
+
+    Returns:
+        the record, prefixed by its length
+    """
+    payload = ROOM_HEADER.pack(started, size, win_length, against_ai, len(moves)) + \
+array('H', moves).tobytes() + ':'.join([room_name] + players + tokens).encode()
+    return protocol.encode_length(len(payload)) + payload
+
+def decode_room(data, start: int = 0) -> tuple[Optional[dict], int]:
+    """
+    Decodes the record starting at start
+
+    Args:
+        data: the snapshot's contents
+
+    Returns:
+        (the room, index after the record), or (None, start) if the record is incomplete
+    """
+    length, prefix_size = protocol.decode_length(data, start)
+    end = start + prefix_size + length
+    if length < 0 or end > len(data):
+        return None, start
+
+    offset = start + prefix_size
+    started, size, win_length, against_ai, n_moves = ROOM_HEADER.unpack_from(data, offset)
+    offset += ROOM_HEADER.size
+    moves = array('H', data[offset:offset + 2 * n_moves]).tolist()
+    names = bytes(data[offset + 2 * n_moves:end]).decode().split(':')
+    seats = (len(names) - 1) // 2
+    return {
+        "room": names[0],
+        "players": names[1:1 + seats],
+        "tokens": names[1 + seats:],
+        "moves": moves,
+        "size": size,
+        "win_length": win_length,
+        "ai": against_ai,
+        "started": started
+    }, end
+
+def write(path: str, records: list[bytes]) -> None:
+    """
+    Writes the snapshot to a file beside path then renames it into place, so a crash
+    while writing never leaves a half written snapshot
+
+    Args:
+        records (list[bytes]): each room, from encode_room()
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, len(records)))
+        f.write(b''.join(records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def read(path: str) -> Iterator[dict]:
+    """
+    Reads every room in the snapshot, in the order they were written
+
+    Raises:
+        ValueError: if the file is not a snapshot this version can read
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, count = FILE_HEADER.unpack_from(data)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} snapshot")
+            start = FILE_HEADER.size
+            for _ in range(count):
+                room, start = decode_room(data, start)
+                if not room:
+                    raise ValueError(f"{path} is cut short")
+                yield room
@@ -0,0 +1,571 @@
+# imports
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+
+# constants and globals
+REPLY_TIMEOUT = 30 # seconds a bot waits for any one reply before counting an error
+BUSY_RETRY = 0.5 # seconds a bot waits before retrying a login the server was too busy for
+MATCH_POLL = 1 # seconds between checks of whether a bot waiting for a match should give up
+SAMPLE_INTERVAL = 1 # seconds between samples of the server's CPU and memory use
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+"""
+Plays games against a running server with scripted bots, then reports how it coped as
+JSON. Each table is two player bots and a number of viewer bots, who create and join a
+room, play a game of random moves, then start the next game in a new room. With
+--quickplay every player bot instead queues for its own games, and is matched with
+whichever player the server pairs it with
+
+All of the following functions use one or more of these args
+
+Args:
+    results (Results): the run's measurements
+    pid (int): process id of the server
+"""
+class BotError(Exception):
+    """
+    A bot received an unexpected reply, or none at all
+    """
+    def __init__(self, kind: str, detail: str) -> None:
+        super().__init__(f"{kind}: {detail}")
+        self.kind = kind
+
+class Results:
+    """
+    Measurements collected by every bot during the run
+    """
+    def __init__(self) -> None:
+        self.move_rtts = [] # seconds from sending each place to its boardstatus or gameend
+        self.login_times = [] # seconds taken by each login, retries included
+        self.match_times = [] # seconds from each quickplay to its game beginning
+        self.moves = 0
+        self.games = 0
+        self.requests = 0 # every message sent that expects a reply
+        self.errors = {} # key - error kind : value - count
+        self.cpu_seconds = 0.0
+        self.rss_samples = [] # bytes used by the server at each sample
+        self.viewer_bytes = 0 # bytes received by every viewer bot while watching
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+class Bot(protocol.Connection):
+    """
+    One client of the server, speaking its framed protocol
+    """
+    def __init__(self, name: str, results: "Results") -> None:
+        super().__init__()
+        self.name = name
+        self.results = results
+        self.reader = None
+        self.writer = None
+        self.received = 0 # bytes received from the server
+
+    def wake(self) -> None:
+        pass
+
+    async def connect(self, host: str, port: int, version: int) -> None:
+        """
+        Connects to the server and switches to the given protocol version
+        """
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP,
+                                                        socket.TCP_NODELAY, 1)
+        await self.request(f"HELLO:{version}", "HELLO", '0')
+        self.version = version
+
+    def send(self, msg: str) -> None:
+        self.writer.write(self.encode(msg.encode()))
+
+    async def recv(self) -> list[str]:
+        """
+        Waits for the next message from the server
+
+        Returns:
+            the message split into its arguments
+
+        Raises:
+            BotError: if the server closes the connection or does not reply in time
+        """
+        msg = self.next_message()
+        while msg is None:
+            try:
+                data = await asyncio.wait_for(self.reader.read(protocol.MAX_MSG_SZ),
+                                              REPLY_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise BotError("timeout", self.name) from None
+            except OSError as e:
+                raise BotError("disconnect", f"{self.name} {e}") from None
+            if not data:
+                raise BotError("disconnect", self.name)
+            self.received += len(data)
+            self.feed(data)
+            msg = self.next_message()
+        return msg
+
+    async def expect(self, msg_type: str, *statuses: str) -> list[str]:
+        """
+        Waits for a message of the given type, with one of the given acknowledgement
+        statuses if any are given
+
+        Returns:
+            the message split into its arguments
+
+        Raises:
+            BotError: if any other message arrives first
+        """
+        msg = await self.recv()
+        if msg[0] != msg_type or (statuses and (len(msg) < 3 or msg[2] not in statuses)):
+            raise BotError("unexpected", f"{self.name} wanted {msg_type} got {':'.join(msg)}")
+        return msg
+
+    async def request(self, msg: str, msg_type: str, *statuses: str) -> list[str]:
+        """
+        Sends a message then waits for its acknowledgement
+
+        Returns:
+            the acknowledgement split into its arguments
+        """
+        self.results.requests += 1
+        self.send(msg)
+        return await self.expect(msg_type, *statuses)
+
+    async def log_in(self, password: str) -> None:
+        """
+        Registers the bot's user, if not registered by an earlier run, then logs in,
+        retrying whenever the server is too busy hashing
+        """
+        start = time.perf_counter()
+        while (await self.request(f"REGISTER:{self.name}:{password}", "REGISTER",
+                                  '0', '1', '3'))[2] == '3':
+            self.results.error("busy")
+            await asyncio.sleep(BUSY_RETRY)
+        while (await self.request(f"LOGIN:{self.name}:{password}", "LOGIN",
+                                  '0', '4'))[2] == '4':
+            self.results.error("busy")
+            await asyncio.sleep(BUSY_RETRY)
+        self.results.login_times.append(time.perf_counter() - start)
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+
+async def watch(viewer: Bot, results: Results) -> None:
+    """
+    Reads a viewer's messages until its game ends
+    """
+    start = viewer.received
+    await viewer.expect("BEGIN")
+    while (await viewer.recv())[0] != "GAMEEND":
+        pass
+    results.viewer_bytes += viewer.received - start
+
+async def play_game(room_name: str, players: list[Bot], viewers: list[Bot],
+                    results: Results, move_interval: float, stream: bool) -> None:
+    """
+    Plays one game of random moves between two players, with viewers watching
+
+    Args:
+        players (list[Bot]): the player creating the room then the player joining it
+        move_interval (float): seconds each player waits before making a move
+        stream (bool): whether viewers are sent each move rather than each board
+    """
+    first, second = players
+    await first.request(f"CREATE:{room_name}", "CREATE", '0')
+    for viewer in viewers:
+        await viewer.request(f"JOIN:{room_name}:VIEWER" + (":STREAM" if stream else ""),
+                             "JOIN", '0')
+    watchers = [asyncio.create_task(watch(viewer, results)) for viewer in viewers]
+    try:
+        await second.request(f"JOIN:{room_name}:PLAYER", "JOIN", '0')
+        await first.expect("BEGIN")
+        await second.expect("BEGIN")
+
+        free = [(col, row) for row in range(3) for col in range(3)]
+        random.shuffle(free)
+        for turn, (col, row) in enumerate(free):
+            mover, waiting = players[turn % 2], players[(turn + 1) % 2]
+            if move_interval:
+                await asyncio.sleep(move_interval)
+            start = time.perf_counter()
+            mover.send(f"PLACE:{col}:{row}")
+            reply = await mover.recv()
+            results.move_rtts.append(time.perf_counter() - start)
+            results.requests += 1
+            results.moves += 1
+            if reply[0] not in ("BOARDSTATUS", "GAMEEND"):
+                raise BotError("unexpected", f"{mover.name} got {':'.join(reply)}")
+            if (await waiting.recv())[0] != reply[0]:
+                raise BotError("unexpected", f"{waiting.name} missed {reply[0]}")
+            if reply[0] == "GAMEEND":
+                break
+        await asyncio.gather(*watchers)
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+    results.games += 1
+
+async def play_quickplay(bot: Bot, results: Results, move_interval: float,
+                         deadline: float) -> bool:
+    """
+    Queues for one game then plays random moves in it, against whichever player the
+    server matched the bot with
+
+    Args:
+        move_interval (float): seconds the bot waits before making a move
+        deadline (float): time the run ends, a bot left unmatched after it stops waiting
+
+    Returns:
+        True if the bot played a game, else false if it was left unmatched
+    """
+    start = time.perf_counter()
+    await bot.request("QUICKPLAY", "QUICKPLAY", '0')
+    begin = []
+    while not begin:
+        try:
+            begin = await asyncio.wait_for(bot.expect("BEGIN"), MATCH_POLL)
+        except asyncio.TimeoutError:
+            if time.monotonic() >= deadline:
+                return False
+    results.match_times.append(time.perf_counter() - start)
+
+    seat = begin.index(bot.name) - 1
+    board = "0" * 9
+    turn = 0
+    while True:
+        if turn % 2 == seat:
+            if move_interval:
+                await asyncio.sleep(move_interval)
+            cell = random.choice([cell for cell, taken in enumerate(board) if taken == '0'])
+            start = time.perf_counter()
+            bot.send(f"PLACE:{cell % 3}:{cell // 3}")
+            reply = await bot.recv()
+            results.move_rtts.append(time.perf_counter() - start)
+            results.requests += 1
+            results.moves += 1
+        else:
+            reply = await bot.recv()
+        if reply[0] not in ("BOARDSTATUS", "GAMEEND"):
+            raise BotError("unexpected", f"{bot.name} got {':'.join(reply)}")
+        if reply[0] == "GAMEEND":
+            # each game is counted once, by its first player
+            results.games += seat == 0
+            return True
+        board = reply[1]
+        turn += 1
+
+async def connect_table(table: int, args: argparse.Namespace, results: Results,
+                        logins: asyncio.Semaphore) -> list[Bot]:
+    """
+    Connects and logs in a table's bots
+
+    Args:
+        logins (asyncio.Semaphore): limits how many bots log in at once
+
+    Returns:
+        the table's players then viewers, or an empty list if any could not log in
+    """
+    bots = [Bot(f"{args.user_prefix}{table}_{seat}", results)
+            for seat in range(2 + args.viewers)]
+    try:
+        for bot in bots:
+            await bot.connect(args.host, args.port, args.version)
+            async with logins:
+                await bot.log_in(args.password)
+        return bots
+    except BotError as e:
+        results.error(e.kind)
+        print(f"Table {table} could not log in: {e}", file=sys.stderr)
+    except OSError as e:
+        results.error("connect")
+        print(f"Table {table} could not connect: {e}", file=sys.stderr)
+    for bot in bots:
+        bot.close()
+    return []
+
+async def play_table(table: int, bots: list[Bot], args: argparse.Namespace,
+                     results: Results, deadline: float) -> None:
+    """
+    Plays games until the deadline, or the table's game count is reached, stopping
+    early if a bot errors
+    """
+    if args.quickplay:
+        await asyncio.gather(*(
+            quickplay_bot(bot, args, results, deadline) for bot in bots[:2]
+        ))
+        for bot in bots:
+            bot.close()
+        return
+
+    game = 0
+    try:
+        while time.monotonic() < deadline and (not args.games or game < args.games):
+            # players take turns creating the room, and so going first
+            players = bots[:2] if game % 2 == 0 else bots[1::-1]
+            room_name = f"{args.room_prefix}{table}_{game}"
+            await play_game(room_name, players, bots[2:], results, args.move_interval,
+                            args.stream)
+            game += 1
+    except BotError as e:
+        results.error(e.kind)
+        print(f"Table {table} stopped: {e}", file=sys.stderr)
+    finally:
+        for bot in bots:
+            bot.close()
+
+async def quickplay_bot(bot: Bot, args: argparse.Namespace, results: Results,
+                        deadline: float) -> None:
+    """
+    Plays quickplay games until the deadline, or the bot's game count is reached,
+    stopping early if the bot errors
+    """
+    game = 0
+    try:
+        while time.monotonic() < deadline and (not args.games or game < args.games):
+            if not await play_quickplay(bot, results, args.move_interval, deadline):
+                return
+            game += 1
+    except BotError as e:
+        results.error(e.kind)
+        print(f"{bot.name} stopped: {e}", file=sys.stderr)
+
+def process_tree(pid: int) -> list[int]:
+    """
+    Returns:
+        the process id of the server and every process it started, such as its workers
+        and hash pool
+    """
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as children:
+                    pids += [int(child) for child in children.read().split()]
+        except OSError:
+            pass
+    return pids
+
+def server_usage(pid: int) -> tuple[float, int]:
+    """
+    Reads how much the server and its processes have used so far
+
+    Returns:
+        (CPU seconds used, bytes of memory resident)
+    """
+    cpu_seconds = 0.0
+    rss = 0
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/stat") as stat:
+                # fields after the command name, which may itself hold spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        cpu_seconds += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu_seconds, rss
+
+async def sample_server(pid: int, results: Results) -> None:
+    """
+    Samples the server's CPU and memory use until cancelled
+    """
+    start_cpu, _ = server_usage(pid)
+    try:
+        while True:
+            cpu_seconds, rss = server_usage(pid)
+            results.cpu_seconds = cpu_seconds - start_cpu
+            results.rss_samples.append(rss)
+            await asyncio.sleep(SAMPLE_INTERVAL)
+    finally:
+        cpu_seconds, rss = server_usage(pid)
+        results.cpu_seconds = cpu_seconds - start_cpu
+        results.rss_samples.append(rss)
+
+def percentiles(samples: list[float]) -> dict:
+    """
+    Summarises latencies in milliseconds
+
+    Returns:
+        dictionary of the median, 99th percentile and largest latency
+    """
+    if not samples:
+        return {"p50": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {"p50": at(0.5), "p99": at(0.99), "max": round(ordered[-1] * 1000, 3)}
+
+def commit() -> str:
+    """
+    Returns:
+        the git commit of the server being tested, empty if not in a git repository
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def report(args: argparse.Namespace, results: Results, play_time: float) -> dict:
+    """
+    Returns:
+        the run's configuration and results, ready to save as JSON
+    """
+    rss = results.rss_samples
+    return {
+        "label": args.label,
+        "commit": commit(),
+        "tables": args.tables,
+        "viewers_per_table": args.viewers,
+        "connections": args.tables * (2 + args.viewers),
+        "protocol_version": args.version,
+        "move_interval_s": args.move_interval,
+        "play_time_s": round(play_time, 3),
+        "games": results.games,
+        "moves": results.moves,
+        "games_per_s": round(results.games / play_time, 2),
+        "moves_per_s": round(results.moves / play_time, 2),
+        "move_rtt_ms": percentiles(results.move_rtts),
+        "login_ms": percentiles(results.login_times),
+        "quickplay": args.quickplay,
+        "match_ms": percentiles(results.match_times),
+        "stream": args.stream,
+        "viewer_bytes_per_game": round(results.viewer_bytes / max(1, results.games \
+* args.viewers)) if args.viewers else None,
+        "errors": results.errors,
+        "error_rate": round(sum(results.errors.values()) / max(1, results.requests), 6),
+        "server_cpu_percent": round(results.cpu_seconds / play_time * 100, 1) \
+if rss else None,
+        "server_rss_mb_max": round(max(rss) / 2**20, 1) if rss else None,
+        "server_rss_mb_end": round(rss[-1] / 2**20, 1) if rss else None
+    }
+
+async def run_load(args: argparse.Namespace, pid: int) -> dict:
+    """
+    Logs in every table's bots, then plays at every table at once, sampling the server
+    while they play if its process id is known
+
+    Returns:
+        the run's report
+    """
+    results = Results()
+    logins = asyncio.Semaphore(args.login_concurrency)
+    tables = await asyncio.gather(*(
+        connect_table(table, args, results, logins) for table in range(args.tables)
+    ))
+
+    sampler = asyncio.create_task(sample_server(pid, results)) if pid else None
+    start = time.monotonic()
+    await asyncio.gather(*(
+        play_table(table, bots, args, results, start + args.duration)
+        for table, bots in enumerate(tables) if bots
+    ))
+    play_time = time.monotonic() - start
+    if sampler:
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+    return report(args, results, play_time)
+
+def start_server(config_path: str) -> subprocess.Popen:
+    """
+    Starts a server from the repository with the given config, waiting until it accepts
+    connections
+
+    Returns:
+        the server's process
+    """
+    with open(config_path) as config_file:
+        port = json.load(config_file)["port"]
+    server_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "server.py")
+    process = subprocess.Popen([sys.executable, server_path, config_path],
+                               stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("localhost", port), 0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Plays scripted games against a server "
+                                     "and reports throughput, latency and errors as JSON")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--server", metavar="CONFIG",
+                        help="start server.py with this config for the run, on its port")
+    parser.add_argument("--pid", type=int,
+                        help="process id of an already running server, to sample its "
+                        "CPU and memory use")
+    parser.add_argument("--tables", type=int, default=10,
+                        help="games played at once, each by two player bots")
+    parser.add_argument("--viewers", type=int, default=0, help="viewer bots per table")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to keep starting games for, once every bot has "
+                        "logged in")
+    parser.add_argument("--games", type=int, default=0,
+                        help="games each table plays, 0 for as many as fit the duration")
+    parser.add_argument("--stream", action="store_true",
+                        help="viewers join with STREAM, so are sent each move rather than "
+                        "each board")
+    parser.add_argument("--quickplay", action="store_true",
+                        help="players queue for games with QUICKPLAY rather than creating "
+                        "and joining rooms, viewers are not used")
+    parser.add_argument("--move-interval", type=float, default=0,
+                        help="seconds each player waits before making a move")
+    parser.add_argument("--version", type=int, default=protocol.BINARY_VERSION,
+                        choices=(protocol.FRAMED_VERSION, protocol.BINARY_VERSION),
+                        help="protocol version the bots speak")
+    parser.add_argument("--login-concurrency", type=int, default=16,
+                        help="most bots logging in at once, as logins are hashed")
+    parser.add_argument("--user-prefix", default="loadbot")
+    parser.add_argument("--password", default="loadbot")
+    parser.add_argument("--room-prefix", default=f"load{os.getpid()}_",
+                        help="start of each room name, unique to the run by default")
+    parser.add_argument("--label", default="", help="names the run in the report")
+    parser.add_argument("--output", help="append the report to this file as one JSON line")
+    parsed = parser.parse_args(args)
+    if parsed.server:
+        with open(parsed.server) as config_file:
+            parsed.port = json.load(config_file)["port"]
+    return parsed
+
+def main(args: list[str]) -> None:
+    """
+    Runs the load test, printing the report and appending it to the output file if given
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    args = parse_args(args)
+    process = start_server(args.server) if args.server else None
+    pid = process.pid if process else args.pid
+    try:
+        result = asyncio.run(run_load(args, pid))
+    finally:
+        if process:
+            process.send_signal(signal.SIGINT)
+            process.wait()
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(json.dumps(result) + '\n')
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,174 @@
+# imports
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import resource
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+import server
+import async_server
+
+# constants and globals
+PROJECTED_ROOMS = 100000 # rooms the memory of a full server is projected for
+
+"""
+Measures the memory held by the server's state for each idle room and each connection
+with tracemalloc, so the memory needed for a number of rooms can be worked out ahead of
+time. Only memory allocated by Python is counted, not thread stacks or the kernel's
+socket buffers
+
+An idle room is a room waiting for its second player, as made by CREATE, with its
+lobby entries. A connection is a logged in client in the lobby, its session and the
+engine's connection object over a socket pair
+
+All of the following functions use one or more of these args
+
+Args:
+    mode (str): the engine measured, threaded or asyncio
+    count (int): how many rooms or connections to make
+"""
+def measure(make) -> tuple[int, list]:
+    """
+    Runs make() while tracing memory
+
+    Args:
+        make: function making the objects measured, returning them so they are kept
+
+    Returns:
+        (bytes still held once make() returns, what it returned)
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    made = make()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")), made
+
+def room_bytes(mode: str, count: int) -> float:
+    """
+    Returns:
+        bytes held for each idle room
+    """
+    server.room_signal = async_server.AsyncRoomSignal if mode == "asyncio" \
+else server.RoomSignal
+    placeholder = server.RestoredSeat()
+
+    def make() -> list:
+        for index in range(count):
+            room_name = f"room{index}"
+            server.rooms[room_name] = server.Room(f"user{index}", placeholder)
+            server.update_lobby(room_name, True, True)
+        return []
+
+    held, _ = measure(make)
+    for room_name in list(server.rooms):
+        server.update_lobby(room_name, False, False)
+    server.rooms.clear()
+    return held / count
+
+async def open_connections(count: int) -> list:
+    """
+    Opens count asyncio connections over socket pairs, as the asyncio engine holds them
+
+    Returns:
+        the connections and the other ends of their socket pairs
+    """
+    made = []
+    for index in range(count):
+        ours, theirs = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=ours)
+        client = async_server.StreamClient(reader, writer)
+        server.online_users[client] = server.sessions[str(index)] = \
+server.Session(f"user{index}", str(index), client)
+        made.append((client, theirs))
+    return made
+
+def connection_bytes(mode: str, count: int) -> float:
+    """
+    Returns:
+        bytes held for each connection
+    """
+    if mode == "asyncio":
+        loop = asyncio.new_event_loop()
+        held, made = measure(lambda: loop.run_until_complete(open_connections(count)))
+        for client, theirs in made:
+            client.close()
+            theirs.close()
+        loop.run_until_complete(asyncio.gather(*(client.write_task for client, _ in made)))
+        loop.close()
+    else:
+        def make() -> list:
+            made = []
+            for index in range(count):
+                ours, theirs = socket.socketpair()
+                client = protocol.SocketConnection(ours)
+                server.online_users[client] = server.sessions[str(index)] = \
+server.Session(f"user{index}", str(index), client)
+                made.append((client, theirs))
+            return made
+        held, made = measure(make)
+        for client, theirs in made:
+            client.close()
+            theirs.close()
+
+    server.online_users.clear()
+    server.sessions.clear()
+    return held / count
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measures the memory held for each idle "
+                                     "room and each connection with tracemalloc")
+    parser.add_argument("--mode", choices=("threaded", "asyncio"), default="asyncio",
+                        help="engine whose room signals and connections are measured")
+    parser.add_argument("--rooms", type=int, default=10000, help="idle rooms made")
+    parser.add_argument("--connections", type=int, default=1000,
+                        help="connections opened, each uses two file descriptors")
+    parser.add_argument("--max-room-bytes", type=float,
+                        help="exit with 1 if an idle room holds more than this")
+    parser.add_argument("--max-connection-bytes", type=float,
+                        help="exit with 1 if a connection holds more than this")
+    return parser.parse_args(args)
+
+def main(args: list[str]) -> None:
+    """
+    Measures the memory of rooms and connections, printing the results as JSON
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    args = parse_args(args)
+    async_server.raise_file_limit()
+    per_room = room_bytes(args.mode, args.rooms)
+    per_connection = connection_bytes(args.mode, args.connections)
+    # two players are connected for each room
+    projected = PROJECTED_ROOMS * (per_room + 2 * per_connection)
+    report = {
+        "mode": args.mode,
+        "rooms": args.rooms,
+        "connections": args.connections,
+        "bytes_per_idle_room": round(per_room),
+        "bytes_per_connection": round(per_connection),
+        f"projected_mb_for_{PROJECTED_ROOMS}_rooms": round(projected / 2**20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1)
+    }
+    print(json.dumps(report, indent=2))
+
+    over_budget = False
+    if args.max_room_bytes and per_room > args.max_room_bytes:
+        print(f"Idle rooms hold {per_room:.0f} bytes, over {args.max_room_bytes:.0f}",
+              file=sys.stderr)
+        over_budget = True
+    if args.max_connection_bytes and per_connection > args.max_connection_bytes:
+        print(f"Connections hold {per_connection:.0f} bytes, over "
+              f"{args.max_connection_bytes:.0f}", file=sys.stderr)
+        over_budget = True
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
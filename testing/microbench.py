@@ -0,0 +1,381 @@
+# imports
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import game
+import protocol
+import server
+
+# constants and globals
+MIN_SAMPLE_TIME = 0.05 # seconds each sample should take, loops are raised until it does
+REGRESSION = 0.10 # default slowdown against a baseline that is reported as a regression
+benchmarks = {} # key - benchmark name : value - (function timing n loops, ops per loop)
+
+"""
+Times the code run for every move, game.py's boards and the server's message handling,
+in the style of pyperf: each benchmark is calibrated to a number of loops, warmed up,
+then timed over several samples, reporting the time per operation in nanoseconds
+
+All of the following functions use one or more of these args
+
+Args:
+    loops (int): how many times to run the benchmarked code
+    results (dict): key - benchmark name : value - its timings
+"""
+def benchmark(name: str, ops: int = 1):
+    """
+    Registers a function as a benchmark, which runs its code loops times and returns the
+    seconds taken
+
+    Args:
+        ops (int): operations done by each loop, the reported time is per operation
+    """
+    def register(func):
+        benchmarks[name] = (func, ops)
+        return func
+    return register
+
+def reachable_positions() -> list[tuple[list[int], int, int, int]]:
+    """
+    Finds every position reachable in a 3x3 game, stopping at won positions
+
+    Returns:
+        list of (bitboards, player who moved last, col, row of their move)
+    """
+    positions = []
+    def play(bitboards: list[int], turn: int) -> None:
+        player_index = turn % 2
+        for row in range(game.BOARD_SIZE):
+            for col in range(game.BOARD_SIZE):
+                if game.is_occupied(bitboards, col, row):
+                    continue
+                child = bitboards.copy()
+                bitboard = game.place(child, player_index, col, row)
+                positions.append((child, player_index, col, row))
+                if not game.bitboard_wins(bitboard) and not game.bitboards_draw(child):
+                    play(child, turn + 1)
+    play(game.create_bitboards(), 0)
+
+    # the same position is reached by many move orders, keep one of each
+    unique = {}
+    for position in positions:
+        unique.setdefault(tuple(position[0]), position)
+    return list(unique.values())
+
+def to_board(bitboards: list[int]) -> list[list[str]]:
+    """
+    Returns:
+        the bitboards as game.py's list of rows
+    """
+    board = game.create_board()
+    for player_index, player in enumerate(game.PLAYERS):
+        for row in range(game.BOARD_SIZE):
+            for col in range(game.BOARD_SIZE):
+                if bitboards[player_index] >> (game.BOARD_SIZE * row + col) & 1:
+                    board[row][col] = player
+    return board
+
+POSITIONS = reachable_positions()
+BOARDS = [to_board(bitboards) for bitboards, _, _, _ in POSITIONS]
+PLACE_MSG = "PLACE:1:2"
+BOARD_MSG = "BOARDSTATUS:120120000"
+GAMEEND_MSG = "GAMEEND:120120100:0:alice"
+
+@benchmark("game.create_board")
+def bench_create_board(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        game.create_board()
+    return time.perf_counter() - start
+
+@benchmark("game.create_bitboards")
+def bench_create_bitboards(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        game.create_bitboards()
+    return time.perf_counter() - start
+
+@benchmark("game.player_turn", 9)
+def bench_player_turn(loops: int) -> float:
+    cells = [(col, row) for row in range(3) for col in range(3)]
+    start = time.perf_counter()
+    for _ in range(loops):
+        board = game.create_board()
+        for col, row in cells:
+            game.player_turn(game.CROSS, board, col, row)
+    return time.perf_counter() - start
+
+@benchmark("game.place", 9)
+def bench_place(loops: int) -> float:
+    cells = [(col, row) for row in range(3) for col in range(3)]
+    start = time.perf_counter()
+    for _ in range(loops):
+        bitboards = game.create_bitboards()
+        for col, row in cells:
+            game.place(bitboards, 0, col, row)
+    return time.perf_counter() - start
+
+@benchmark("game.player_wins (every position)", len(BOARDS))
+def bench_player_wins(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for board in BOARDS:
+            game.player_wins(game.CROSS, board)
+    return time.perf_counter() - start
+
+@benchmark("game.players_draw (every position)", len(BOARDS))
+def bench_players_draw(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for board in BOARDS:
+            game.players_draw(board)
+    return time.perf_counter() - start
+
+@benchmark("game.bitboard_wins (every position)", len(POSITIONS))
+def bench_bitboard_wins(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for bitboards, player_index, _, _ in POSITIONS:
+            game.bitboard_wins(bitboards[player_index])
+    return time.perf_counter() - start
+
+@benchmark("game.wins_through (every position)", len(POSITIONS))
+def bench_wins_through(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for bitboards, player_index, col, row in POSITIONS:
+            game.wins_through(bitboards[player_index], col, row)
+    return time.perf_counter() - start
+
+@benchmark("game.bitboards_draw (every position)", len(POSITIONS))
+def bench_bitboards_draw(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for bitboards, _, _, _ in POSITIONS:
+            game.bitboards_draw(bitboards)
+    return time.perf_counter() - start
+
+@benchmark("game.board_status (every position)", len(POSITIONS))
+def bench_board_status(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for bitboards, _, _, _ in POSITIONS:
+            game.board_status(bitboards)
+    return time.perf_counter() - start
+
+@benchmark("server.parse_place")
+def bench_parse_place(loops: int) -> float:
+    data = PLACE_MSG.encode()
+    start = time.perf_counter()
+    for _ in range(loops):
+        server.move_position(data.decode().strip().split(':'), game.BOARD_SIZE)
+    return time.perf_counter() - start
+
+@benchmark("server.boardstatus_msg")
+def bench_boardstatus_msg(loops: int) -> float:
+    room = server.Room("bench", None)
+    room.game_state = POSITIONS[-1][0].copy()
+    start = time.perf_counter()
+    for _ in range(loops):
+        server.board_msg("BOARDSTATUS", room).encode()
+    return time.perf_counter() - start
+
+@benchmark("protocol.encode_binary", 3)
+def bench_encode_binary(loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        protocol.encode_binary(PLACE_MSG)
+        protocol.encode_binary(BOARD_MSG)
+        protocol.encode_binary(GAMEEND_MSG)
+    return time.perf_counter() - start
+
+@benchmark("protocol.decode_payload", 3)
+def bench_decode_payload(loops: int) -> float:
+    payloads = [protocol.encode_binary(msg) for msg in (PLACE_MSG, BOARD_MSG, GAMEEND_MSG)]
+    start = time.perf_counter()
+    for _ in range(loops):
+        for payload in payloads:
+            protocol.decode_payload(payload)
+    return time.perf_counter() - start
+
+class BenchConnection(protocol.Connection):
+    """
+    A connection with no writer, as only its framing is timed
+    """
+    def wake(self) -> None:
+        pass
+
+def bench_encode(version: int):
+    """
+    Makes a benchmark of framing a boardstatus message in the given protocol version
+    """
+    def bench(loops: int) -> float:
+        connection = BenchConnection()
+        connection.version = version
+        data = BOARD_MSG.encode()
+        start = time.perf_counter()
+        for _ in range(loops):
+            connection.encode(data)
+        return time.perf_counter() - start
+    return bench
+
+def bench_next_message(version: int, count: int = 100):
+    """
+    Makes a benchmark of reading count pipelined place messages received at once, in the
+    given protocol version
+    """
+    def bench(loops: int) -> float:
+        connection = BenchConnection()
+        connection.version = version
+        if version == protocol.LEGACY_VERSION:
+            data = (PLACE_MSG + '\n').encode() * count
+        else:
+            data = connection.encode(PLACE_MSG.encode()) * count
+        start = time.perf_counter()
+        for _ in range(loops):
+            connection.feed(data)
+            while connection.next_message() is not None:
+                pass
+        return time.perf_counter() - start
+    return bench
+
+for version in protocol.SUPPORTED_VERSIONS:
+    benchmark(f"protocol.encode (version {version})")(bench_encode(version))
+    benchmark(f"protocol.next_message (version {version})", 100)(bench_next_message(version))
+
+def run_benchmark(func, samples: int, warmups: int) -> dict:
+    """
+    Calibrates how many loops make a sample take MIN_SAMPLE_TIME, then times the samples
+
+    Args:
+        func: the benchmark, taking loops and returning the seconds they took
+        samples (int): how many timed samples to take
+        warmups (int): how many untimed samples to run first
+
+    Returns:
+        dictionary of loops per sample and each sample's seconds
+    """
+    loops = 1
+    while func(loops) < MIN_SAMPLE_TIME:
+        loops *= 2
+    for _ in range(warmups):
+        func(loops)
+    return {"loops": loops, "times": [func(loops) for _ in range(samples)]}
+
+def summarise(timing: dict, ops: int) -> dict:
+    """
+    Returns:
+        the mean, standard deviation, median and minimum nanoseconds per operation
+    """
+    per_op = [seconds / timing["loops"] / ops * 1e9 for seconds in timing["times"]]
+    return {
+        "mean_ns": round(statistics.mean(per_op), 2),
+        "stdev_ns": round(statistics.stdev(per_op), 2) if len(per_op) > 1 else 0.0,
+        "median_ns": round(statistics.median(per_op), 2),
+        "min_ns": round(min(per_op), 2),
+        "loops": timing["loops"],
+        "ops_per_loop": ops,
+        "samples": len(per_op)
+    }
+
+def commit() -> str:
+    """
+    Returns:
+        the git commit being benchmarked, ending in -dirty if it has uncommitted
+        changes, empty if not in a git repository
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Prints each benchmark's change against a baseline
+
+    Args:
+        baseline (dict): an earlier run's saved results
+        threshold (float): the slowdown reported as a regression, as a fraction
+
+    Returns:
+        True if any benchmark is more than threshold slower, else false
+    """
+    regressed = False
+    for name, result in results.items():
+        before = baseline["benchmarks"].get(name)
+        if not before:
+            print(f"{name:45} new")
+            continue
+        # the fastest sample is the least disturbed by the rest of the machine
+        change = result["min_ns"] / before["min_ns"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:45} {before['min_ns']:>12.1f} -> {result['min_ns']:>12.1f} ns "
+              f"({change:+.1%}){flag}")
+    return regressed
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Times game.py and the server's message "
+                                     "handling, saving the results as a JSON baseline")
+    parser.add_argument("--samples", type=int, default=10, help="timed samples per benchmark")
+    parser.add_argument("--warmups", type=int, default=1,
+                        help="untimed samples run before timing")
+    parser.add_argument("--filter", default="",
+                        help="only run benchmarks whose names contain this")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="compare against results saved by --output, exiting with 1 "
+                        "on a regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION,
+                        help="slowdown reported as a regression, as a fraction")
+    return parser.parse_args(args)
+
+def main(args: list[str]) -> None:
+    """
+    Runs the benchmarks, printing each one's time per operation
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    args = parse_args(args)
+    results = {}
+    for name, (func, ops) in benchmarks.items():
+        if args.filter not in name:
+            continue
+        results[name] = summarise(run_benchmark(func, args.samples, args.warmups), ops)
+        print(f"{name:45} {results[name]['median_ns']:>12.1f} ns "
+              f"+- {results[name]['stdev_ns']:.1f}")
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "reachable_positions": len(POSITIONS),
+        "benchmarks": results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+            output.write('\n')
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\nAgainst {args.compare} (commit {baseline.get('commit') or 'unknown'}):")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
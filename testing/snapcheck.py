@@ -0,0 +1,141 @@
+# imports
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import game
+import server
+import async_server
+
+# constants and globals
+MAX_MOVES = 8 # most moves made in each game before it is saved, fewer than any 3x3 game
+              # can end in a draw after
+
+"""
+Times saving every room to a snapshot and restoring them, as the server does when it is
+stopped with ctrl c and started again, and checks the restored rooms match the saved
+ones. Each room holds two players part way through a 3x3 game, with their sessions
+
+All of the following functions use one or more of these args
+
+Args:
+    count (int): how many rooms to make
+"""
+def make_rooms(count: int) -> None:
+    """
+    Fills the server's rooms with games of random moves, stopping before any is won
+    """
+    rng = random.Random(count)
+    for index in range(count):
+        room_name = f"room{index}"
+        seats = [server.RestoredSeat(), server.RestoredSeat()]
+        room = server.Room(f"x{index}", seats[0])
+        room.players.append(f"o{index}")
+        room.p_sockets.append(seats[1])
+        room.game_begun = True
+        room.started = time.time()
+        cells = rng.sample(range(game.BOARD_SIZE ** 2), rng.randint(0, MAX_MOVES))
+        for cell in cells:
+            col, row = cell % room.size, cell // room.size
+            bitboard = game.place(room.game_state, room.turn % 2, col, row, room.size)
+            room.moves.append(cell)
+            room.turn += 1
+            if game.wins_through(bitboard, col, row, room.size, room.win_length):
+                break
+        server.rooms[room_name] = room
+
+        for seat, username in enumerate(room.players):
+            token = f"{index}-{seat}"
+            session = server.Session(username, token, seats[seat])
+            session.room = room_name
+            session.type = "P" + str(seat + 1)
+            server.online_users[seats[seat]] = server.sessions[token] = session
+
+def clear() -> None:
+    """
+    Empties the server's rooms, sessions and lobby
+    """
+    server.rooms.clear()
+    server.sessions.clear()
+    server.online_users.clear()
+    server.held_players.clear()
+    for mode in server.lobby:
+        server.lobby[mode].clear()
+        server.lobby_sorted[mode] = []
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Times saving every room to a snapshot "
+                                     "and restoring them")
+    parser.add_argument("--mode", choices=("threaded", "asyncio"), default="asyncio",
+                        help="engine whose room signals the restored rooms are given")
+    parser.add_argument("--rooms", type=int, default=100000, help="rooms saved")
+    parser.add_argument("--max-save-seconds", type=float,
+                        help="exit with 1 if saving takes longer than this")
+    parser.add_argument("--max-restore-seconds", type=float,
+                        help="exit with 1 if restoring takes longer than this")
+    return parser.parse_args(args)
+
+def main(args: list[str]) -> None:
+    """
+    Saves and restores the rooms, printing the results as JSON
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    args = parse_args(args)
+    server.room_signal = async_server.AsyncRoomSignal if args.mode == "asyncio" \
+else server.RoomSignal
+    make_rooms(args.rooms)
+    saved = {
+        room_name: (room.players, room.moves, room.game_state, room.turn)
+        for room_name, room in server.rooms.items()
+    }
+
+    path = os.path.join(tempfile.mkdtemp(), "rooms.snapshot")
+    start = time.perf_counter()
+    server.save_rooms(path)
+    save_seconds = time.perf_counter() - start
+    size = os.path.getsize(path)
+
+    clear()
+    start = time.perf_counter()
+    restored = server.restore_rooms(path)
+    restore_seconds = time.perf_counter() - start
+    matches = restored == len(saved) and all(
+        (room.players, room.moves, room.game_state, room.turn) == saved[room_name]
+        for room_name, room in server.rooms.items()
+    ) and len(server.held_players) == 2 * len(saved)
+    os.rmdir(os.path.dirname(path))
+
+    report = {
+        "mode": args.mode,
+        "rooms": args.rooms,
+        "snapshot_bytes": size,
+        "bytes_per_room": round(size / args.rooms, 1),
+        "save_seconds": round(save_seconds, 3),
+        "restore_seconds": round(restore_seconds, 3),
+        "restored_rooms_match": matches
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = not matches
+    if not matches:
+        print("Restored rooms do not match the saved rooms", file=sys.stderr)
+    if args.max_save_seconds and save_seconds > args.max_save_seconds:
+        print(f"Saving took {save_seconds:.3f}s, over {args.max_save_seconds}s",
+              file=sys.stderr)
+        failed = True
+    if args.max_restore_seconds and restore_seconds > args.max_restore_seconds:
+        print(f"Restoring took {restore_seconds:.3f}s, over {args.max_restore_seconds}s",
+              file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,129 @@
+# imports
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+import metrics
+import server
+
+# constants and globals
+QUEUE_LIMIT = 4 # messages the viewer may fall behind by
+BOARD_SIZE = 5 # the game is played on a 5x5 board with five in a row to win
+MOVES = 12 # moves played, more than the viewer can queue and fewer than can end the game
+
+"""
+Checks each slow viewer policy by playing moves in a room whose one viewer never reads,
+so it falls QUEUE_LIMIT messages behind, then checks the game carried on for every move
+and that the viewer was only sent the latest boards, or was dropped
+
+All of the following functions use one or more of these args
+
+Args:
+    policy (str): the slow viewer policy checked, coalesce or disconnect
+"""
+class StalledConnection(protocol.Connection):
+    """
+    A connection whose queued messages are never written, as for a client that has
+    stopped reading
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.shut_down = False
+
+    def wake(self) -> None:
+        pass
+
+    def shutdown(self, how: int) -> None:
+        self.shut_down = True
+
+def play(policy: str) -> dict:
+    """
+    Plays MOVES moves in a room with a stalled viewer
+
+    Returns:
+        what happened to the game and the viewer
+    """
+    server.slow_viewer_policy = policy
+    server.viewer_queue_limit = QUEUE_LIMIT
+    metrics.counters.clear()
+
+    players = [StalledConnection(), StalledConnection()]
+    viewer = StalledConnection()
+    room = server.Room("x", players[0], BOARD_SIZE, BOARD_SIZE)
+    room.players.append("o")
+    room.p_sockets.append(players[1])
+    room.game_begun = True
+    room.viewers[viewer] = "viewer"
+    server.rooms["room"] = room
+    for index, (client_socket, username) in enumerate(zip(players + [viewer],
+                                                          ["x", "o", "viewer"])):
+        session = server.Session(username, str(index), client_socket)
+        session.room = "room"
+        server.online_users[client_socket] = server.sessions[session.token] = session
+
+    # columns in turn along each row, so no one has five in a row
+    moved = 0
+    for cell in range(MOVES):
+        col, row = cell % BOARD_SIZE, cell // BOARD_SIZE
+        move = ["PLACE", str(col), str(row)]
+        if server.play_move(players[room.turn % 2], "room", move):
+            break
+        moved += 1
+
+    result = {
+        "moves_played": moved,
+        "turn": room.turn,
+        "moves_recorded": len(room.moves),
+        "viewer_dropped": viewer.shut_down,
+        "viewer_in_room": viewer in room.viewers,
+        "viewer_queued": len(viewer.outbox),
+        "slow_viewers_dropped": metrics.counters.get("slow_viewers_dropped", 0)
+    }
+    server.rooms.clear()
+    server.online_users.clear()
+    server.sessions.clear()
+    return result
+
+def passed(policy: str, result: dict) -> bool:
+    """
+    Returns:
+        True if every move was played and the viewer was handled as the policy says, a
+        dropped viewer being taken out of the room and only dropped once
+    """
+    game_ok = result["moves_played"] == result["turn"] == result["moves_recorded"] == MOVES
+    if policy == "disconnect":
+        return game_ok and result["viewer_dropped"] and not result["viewer_in_room"] and \
+result["slow_viewers_dropped"] == 1
+    return game_ok and not result["viewer_dropped"] and result["viewer_queued"] <= QUEUE_LIMIT
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Checks the slow viewer policies with a "
+                                     "viewer that never reads")
+    parser.add_argument("--policy", choices=("coalesce", "disconnect"), action="append",
+                        help="policy checked, may be given more than once, both if not given")
+    return parser.parse_args(args)
+
+def main(args: list[str]) -> None:
+    """
+    Checks each policy, printing the results as JSON
+
+    Args:
+        args (list[str]): command line arguments, see --help
+    """
+    args = parse_args(args)
+    report = {}
+    failed = False
+    for policy in args.policy or ["coalesce", "disconnect"]:
+        report[policy] = play(policy)
+        if not passed(policy, report[policy]):
+            print(f"The {policy} policy did not handle the slow viewer", file=sys.stderr)
+            failed = True
+    print(json.dumps(report, indent=2))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
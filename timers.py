@@ -0,0 +1,139 @@
+# imports
+import time
+import math
+import threading
+import logs
+
+# constants and globals
+TICK = 0.1 # seconds each slot of the innermost wheel covers
+SLOTS = 64 # slots in each wheel
+LEVELS = 4 # wheels, each slot of one covering a whole turn of the wheel inside it, so
+           # timers may be up to TICK * SLOTS ** LEVELS seconds (about 19 days) away
+timer_log = logs.get("timers")
+
+"""
+Timers are kept in a hierarchical timing wheel, so starting or cancelling one is O(1)
+and each tick only looks at the timers due in it, however many are waiting. A timer is
+put in the innermost wheel whose turn reaches it, and moved inwards as the wheel outside
+it turns, so each timer is moved at most LEVELS times
+A whole server holds one wheel, turned by a thread of its own, or by the event loop in
+the asyncio engine, rather than a thread or scan for each connection
+
+All of the following functions use one or more of these args
+
+Args:
+    delay (float): seconds until the timer is due
+    func: function called with no arguments once the timer is due
+"""
+class Timer:
+    """
+    A function waiting in the wheel until the tick it is due
+    """
+    __slots__ = ("due", "func")
+
+    def __init__(self, due: int, func) -> None:
+        self.due = due # the tick the timer is due in
+        self.func = func # None once cancelled
+
+    def cancel(self) -> None:
+        """
+        Stops the timer from being called, it is dropped from the wheel once due
+        """
+        self.func = None
+
+class TimerWheel:
+    """
+    Holds timers in LEVELS wheels of SLOTS slots each, the slot a timer is in being
+    picked by the tick it is due in, so timers are never sorted or searched
+    Timers may be started from any thread, their functions are called by the thread
+    turning the wheel
+    """
+    def __init__(self, tick: float = TICK) -> None:
+        self.tick = tick
+        self.now = int(time.monotonic() / tick) # the last tick handled
+        self.wheels = [[[] for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.pending = 0 # timers in the wheels, cancelled ones included
+        self.lock = threading.Lock()
+
+    def schedule(self, delay: float, func) -> Timer:
+        """
+        Starts a timer, it is called in the first tick at least delay seconds away
+
+        Returns:
+            the timer, so it can be cancelled
+        """
+        # counted from the time now rather than the last tick, so timers are never early
+        due = math.ceil((time.monotonic() + delay) / self.tick)
+        with self.lock:
+            timer = Timer(min(max(due, self.now + 1), self.now + SLOTS ** LEVELS - 1), func)
+            self.place(timer)
+            self.pending += 1
+        return timer
+
+    def place(self, timer: Timer) -> None:
+        """
+        Puts a timer in the slot of the innermost wheel whose turn reaches it, called
+        holding the lock
+        """
+        ticks = timer.due - self.now
+        level = 0
+        while level < LEVELS - 1 and ticks >= SLOTS ** (level + 1):
+            level += 1
+        self.wheels[level][timer.due // SLOTS ** level % SLOTS].append(timer)
+
+    def advance(self, now: float) -> None:
+        """
+        Turns the wheel up to the tick of now, calling every timer due on the way
+
+        Args:
+            now (float): the time from time.monotonic()
+        """
+        due = []
+        with self.lock:
+            target = int(now / self.tick)
+            while self.now < target:
+                self.now += 1
+                # timers in an outer wheel's slot are moved inwards as the slot comes up
+                for level in range(LEVELS - 1, 0, -1):
+                    if self.now % SLOTS ** level == 0:
+                        slot = self.now // SLOTS ** level % SLOTS
+                        moving = self.wheels[level][slot]
+                        self.wheels[level][slot] = []
+                        for timer in moving:
+                            self.place(timer)
+                slot = self.now % SLOTS
+                due += self.wheels[0][slot]
+                self.wheels[0][slot] = []
+            self.pending -= len(due)
+
+        for timer in due:
+            if timer.func:
+                try:
+                    timer.func()
+                except Exception:
+                    timer_log.exception("Timer failed")
+
+wheel = TimerWheel()
+
+def call_later(delay: float, func) -> Timer:
+    """
+    Starts a timer in the server's wheel
+
+    Returns:
+        the timer, so it can be cancelled
+    """
+    return wheel.schedule(delay, func)
+
+def run() -> None:
+    """
+    Turns the server's wheel once each tick until the program exits
+    """
+    while True:
+        time.sleep(wheel.tick - time.monotonic() % wheel.tick)
+        wheel.advance(time.monotonic())
+
+def start() -> None:
+    """
+    Starts a thread turning the server's wheel, used by the threaded engine
+    """
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,283 @@
+# imports
+import abc
+import sys
+import os
+import json
+import sqlite3
+import threading
+
+# constants and globals
+RESULTS = ("wins", "losses", "draws", "forfeits") # the game results counted for each user
+STATS_INTERVAL = 5 # most seconds game results are held before being written
+
+"""
+All of the following classes use one or more of these args
+
+Args:
+    path (str): The path of the file the users are stored in
+    username (str): The user's name, used as their key
+    password (str): The user's bcrypt hashed password
+    counts (list[int]): A user's number of each of RESULTS
+"""
+class UserStore(abc.ABC):
+    """
+    Holds registered users in an in memory hash index, so lookups never touch the disk
+    New users are written by a background thread, all users registered while the
+    previous write was running are written together as one batch
+    Each user's game results are counted in memory too, and written by the same thread
+    at most STATS_INTERVAL seconds later, so finishing a game never touches the disk
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.stats = {} # key - username : value - counts, filled in by load()
+        self.index = self.load() # key - username : value - password
+        self.pending = [] # (username, password) waiting to be written
+        self.pending_stats = {} # key - username : value - counts not yet written
+        self.flushing = False # whether the writer should write the results straight away
+        self.started = 0 # number of batches taken by the writer so far
+        self.written = 0 # number of batches written so far
+        self.condition = threading.Condition()
+        threading.Thread(target=self.writer, daemon=True).start()
+
+    @abc.abstractmethod
+    def load(self) -> dict:
+        """
+        Reads every stored user
+
+        Returns:
+            dictionary of username to password
+        """
+
+    @abc.abstractmethod
+    def persist(self, batch: list[tuple[str, str]]) -> None:
+        """
+        Writes a batch of new users to storage
+
+        Args:
+            batch (list[tuple[str, str]]): holds (username, password) of each new user
+        """
+
+    @abc.abstractmethod
+    def persist_stats(self, batch: dict) -> None:
+        """
+        Writes a batch of game results to storage
+
+        Args:
+            batch (dict): key - username : value - counts to add to what is stored
+        """
+
+    def find(self, username: str) -> str:
+        """
+        Looks for username in the index
+
+        Returns:
+            password if found, else empty string
+        """
+        return self.index.get(username, "")
+
+    def add(self, username: str, password: str) -> bool:
+        """
+        Adds a new user, returning once they have been written to storage
+
+        Returns:
+            True if added, else false if the username already exists
+        """
+        with self.condition:
+            if username in self.index:
+                return False
+            self.index[username] = password
+            self.pending.append((username, password))
+            batch = self.started + 1
+            self.condition.notify_all()
+            # wait for the batch this user is in to be written
+            self.condition.wait_for(lambda: self.written >= batch)
+        return True
+
+    def count_result(self, username: str, result: int) -> list[int]:
+        """
+        Counts a game result for a user, to be written with the next batch
+
+        Args:
+            result (int): index of the result in RESULTS
+
+        Returns:
+            the user's counts
+        """
+        with self.condition:
+            counts = self.stats.setdefault(username, [0] * len(RESULTS))
+            counts[result] += 1
+            self.pending_stats.setdefault(username, [0] * len(RESULTS))[result] += 1
+        return counts
+
+    def writer(self) -> None:
+        """
+        Writes pending users in batches until the program exits, along with the game
+        results counted since the last batch
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.flushing, STATS_INTERVAL)
+                self.flushing = False
+                batch = self.pending
+                self.pending = []
+                stats_batch = self.pending_stats
+                self.pending_stats = {}
+                self.started += 1
+            if batch:
+                self.persist(batch)
+            if stats_batch:
+                self.persist_stats(stats_batch)
+            with self.condition:
+                self.written += 1
+                self.condition.notify_all()
+
+    def flush(self) -> None:
+        """
+        Writes any game results not yet written, called when the server closes
+        """
+        with self.condition:
+            batch = self.started + 1
+            self.flushing = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.written >= batch)
+
+class JsonUserStore(UserStore):
+    """
+    Stores users in a json list, rewriting the file for each batch of new users or game
+    results, users who have played hold their count of each of RESULTS
+    """
+    def load(self) -> dict:
+        with open(self.path, 'r') as f:
+            user_data = json.load(f)
+        for user in user_data:
+            if "wins" in user:
+                self.stats[user["username"]] = [user[result] for result in RESULTS]
+        return {user["username"]: user["password"] for user in user_data}
+
+    def persist(self, batch: list[tuple[str, str]]) -> None:
+        with self.condition:
+            stats = {username: counts.copy() for username, counts in self.stats.items()}
+        user_data = []
+        for username, password in self.index.copy().items():
+            user = {"username": username, "password": password}
+            if username in stats:
+                user.update(zip(RESULTS, stats[username]))
+            user_data.append(user)
+        with open(self.path, 'w') as f:
+            json.dump(user_data, f, indent=4)
+
+    def persist_stats(self, batch: dict) -> None:
+        self.persist([])
+
+class SqliteUserStore(UserStore):
+    """
+    Stores users in a sqlite database in WAL mode, indexed by username, so registering
+    only appends the new users
+    The one connection is shared by the client threads and the writer, so each use of
+    it holds the store's connection lock
+    """
+    def load(self) -> dict:
+        self.connection_lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS stats (username TEXT PRIMARY KEY, wins INTEGER, " \
+"losses INTEGER, draws INTEGER, forfeits INTEGER)"
+        )
+        self.connection.commit()
+        for username, *counts in self.connection.execute("SELECT * FROM stats"):
+            self.stats[username] = counts
+        return dict(self.connection.execute("SELECT username, password FROM users"))
+
+    def find(self, username: str) -> str:
+        """
+        Looks for username in the index, then in the database, which other server
+        processes may have added it to
+        """
+        password = self.index.get(username, "")
+        if not password:
+            with self.connection_lock:
+                row = self.connection.execute(
+                    "SELECT password FROM users WHERE username = ?", (username,)
+                ).fetchone()
+            password = row[0] if row else ""
+        return password
+
+    def persist(self, batch: list[tuple[str, str]]) -> None:
+        with self.connection_lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", batch
+            )
+
+    def persist_stats(self, batch: dict) -> None:
+        """
+        Adds the batch's counts to those stored, rather than replacing them, so the
+        results of games in other server processes are kept
+        """
+        with self.connection_lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO stats VALUES (?, ?, ?, ?, ?) ON CONFLICT (username) DO UPDATE " \
+"SET wins = wins + excluded.wins, losses = losses + excluded.losses, " \
+"draws = draws + excluded.draws, forfeits = forfeits + excluded.forfeits",
+                [(username, *counts) for username, counts in batch.items()]
+            )
+
+stores = {
+    "json": JsonUserStore,
+    "sqlite": SqliteUserStore
+}
+
+def open_store(kind: str, path: str) -> UserStore:
+    """
+    Opens the user store of the requested kind
+
+    Args:
+        kind (str): the storage backend, a key of stores
+
+    Returns:
+        the opened user store
+    """
+    return stores[kind](os.path.expanduser(path))
+
+def import_json(json_path: str, store: UserStore) -> int:
+    """
+    Copies every user from a json user database into another store, skipping usernames
+    it already holds
+
+    Args:
+        json_path (str): path of the json user database
+
+    Returns:
+        number of users imported
+    """
+    with open(json_path, 'r') as f:
+        user_data = json.load(f)
+
+    batch = [
+        (user["username"], user["password"])
+        for user in user_data if user["username"] not in store.index
+    ]
+    with store.condition:
+        for username, password in batch:
+            store.index[username] = password
+    if batch:
+        store.persist(batch)
+    return len(batch)
+
+def main(args: list[str]) -> None:
+    """
+    Imports a json user database into a sqlite user database
+
+    Args:
+        args (list[str]): holds [0] json database path [1] sqlite database path
+    """
+    store = open_store("sqlite", args[1])
+    count = import_json(os.path.expanduser(args[0]), store)
+    print(f"Imported {count} users into {args[1]}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])